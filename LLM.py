@@ -1,84 +1,258 @@
+import logging
 import os
-import torch
-import ollama
-from diffusers import StableDiffusionPipeline
+import time
 
-from langchain_core.prompts import PromptTemplate
-from langchain_ollama import ChatOllama
+import backpressure
+import config
+import metrics
+import registry
 
+logger = logging.getLogger(__name__)
 
-class get_result:
-    def __init__(self):
-        # Ollama LAN client (optional direct use)
-        self.client = ollama.Client(host="http://172.18.1.152:11434")
 
-        # ✅ Single LLM for EVERYTHING (QA + summarization)
-        self.llm = ChatOllama(
-            model="llama3.1",
-            temperature=0.3,  # lower = better academic summarization
-            base_url="http://172.18.1.152:11434"
-        )
+# ==========================================================
+# PROMPTS (turned into chains once per process)
+# ==========================================================
+EXTRACT_PROMPT = """
+    ### Chat History:
+    {recent_history}
 
-    # ==========================================================
-    # MAIN QA / RAG RESPONSE
-    # ==========================================================
-    def extract_result(self, text, query, recent_history, references_for_each_chunk):
+    ### User Question:
+    {query}
+
+    ### Retrieved Text Chunks:
+    {text_chunks}
+
+    ### Corresponding References:
+    {references_for_each_chunk}
+
+    ### Instructions:
+    You are an academic research assistant specializing in disaster management.
+
+    Strict rules:
+    - Cite only valid references (no placeholders)
+    - IEEE in-text citations [1], [2]
+    - No references section if none are valid
+    - Academic tone, no AI mentions
+    - If unrelated to disaster management:
+      "I can't answer, please ask questions relevant to disaster management."
+
+    ### NO PREAMBLE
+    ### Response:
+    """
+
+SUMMARIZE_PROMPT = """
+    You are an academic disaster management expert.
 
-        prompt_extract = PromptTemplate.from_template(
-            """
-            ### Chat History:
-            {recent_history}
+    Summarize the following text:
+    - Preserve technical accuracy
+    - Keep cause–effect relationships
+    - Maximum {max_words} words
+    - No preamble
 
-            ### User Question:
-            {query}
+    ### Text:
+    {text}
 
-            ### Retrieved Text Chunks:
-            {text_chunks}
+    ### Summary:
+    """
 
-            ### Corresponding References:
-            {references_for_each_chunk}
+CONVERSATION_SUMMARY_PROMPT = """
+    You maintain the memory of a conversation with a disaster management research assistant.
 
-            ### Instructions:
-            You are an academic research assistant specializing in disaster management.
+    Update the summary with the new exchanges:
+    - Keep the user's goals, questions and constraints
+    - Keep key findings, figures and sources from the answers
+    - Drop pleasantries and repetition
+    - Maximum {max_words} words
+    - No preamble
 
-            Strict rules:
-            - Cite only valid references (no placeholders)
-            - IEEE in-text citations [1], [2]
-            - No references section if none are valid
-            - Academic tone, no AI mentions
-            - If unrelated to disaster management:
-              "I can't answer, please ask questions relevant to disaster management."
+    ### Current Summary:
+    {summary}
 
-            ### NO PREAMBLE
-            ### Response:
-            """
+    ### New Exchanges:
+    {turns}
+
+    ### Updated Summary:
+    """
+
+COMBINE_PROMPT = """
+    Combine the following summaries into one coherent academic summary.
+    Remove redundancy and improve logical flow.
+
+    ### Summaries:
+    {summaries}
+
+    ### Final Summary:
+    """
+
+PROMPTS = {
+    "extract": EXTRACT_PROMPT,
+    "summarize": SUMMARIZE_PROMPT,
+    "conversation_summary": CONVERSATION_SUMMARY_PROMPT,
+    "combine": COMBINE_PROMPT,
+}
+
+
+# ==========================================================
+# SHARED OLLAMA GATEWAY
+# ==========================================================
+class LLMGateway:
+    """One pooled Ollama connection and set of prompt chains per process."""
+
+    def __init__(self):
+        # Imported here so workers that never call the LLM don't pay for langchain.
+        import httpx
+        import ollama
+        from langchain_core.prompts import PromptTemplate
+        from langchain_ollama import ChatOllama
+
+        # Failures worth another attempt: the Ollama box is unreachable, slow or overloaded.
+        # Ollama's own errors only count when they are 5xx; a 4xx will fail the same way again.
+        self.retryable = (httpx.TransportError, ollama.ResponseError, ConnectionError, TimeoutError)
+        self._response_error = ollama.ResponseError
+        client_kwargs = {
+            "timeout": config.OLLAMA_TIMEOUT,
+            "limits": httpx.Limits(max_connections=config.LLM_CONCURRENCY,
+                                   max_keepalive_connections=config.LLM_CONCURRENCY)
+        }
+        # Ollama client for direct use (model preloading)
+        self.client = ollama.Client(host=config.OLLAMA_HOST, **client_kwargs)
+
+        # ✅ Single LLM for EVERYTHING (QA + summarization)
+        self.llm = ChatOllama(
+            model=config.OLLAMA_MODEL,
+            temperature=config.LLM_TEMPERATURE,  # lower = better academic summarization
+            base_url=config.OLLAMA_HOST,
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+            client_kwargs=client_kwargs
         )
+        self.chains = {name: PromptTemplate.from_template(prompt) | self.llm for name, prompt in PROMPTS.items()}
+
+    def _should_retry(self, error):
+        if isinstance(error, self._response_error):
+            return error.status_code >= 500
+        return True
+
+    def _backoff(self, attempt, error):
+        delay = config.OLLAMA_RETRY_BACKOFF * (2 ** attempt)
+        logger.warning("Ollama call failed (%s), retrying in %.1fs", error, delay)
+        time.sleep(delay)
+
+    def _acquire(self):
+        # The single Ollama box serves everyone; callers queue here instead of piling onto it.
+        with metrics.span("llm_queue"):
+            return backpressure.LLM.acquire()
+
+    def invoke(self, chain, inputs):
+        for attempt in range(config.OLLAMA_RETRIES + 1):
+            try:
+                ticket = self._acquire()
+                try:
+                    with metrics.span(f"llm_{chain}"):
+                        return self.chains[chain].invoke(inputs).content
+                finally:
+                    backpressure.LLM.release(ticket)
+            except self.retryable as e:
+                if attempt == config.OLLAMA_RETRIES or not self._should_retry(e):
+                    raise
+                self._backoff(attempt, e)
+
+    def stream(self, chain, inputs):
+        # Retries only happen before the first token; a half-sent answer cannot be replayed.
+        for attempt in range(config.OLLAMA_RETRIES + 1):
+            started = False
+            try:
+                ticket = self._acquire()
+                try:
+                    with metrics.span(f"llm_{chain}"):
+                        start = time.perf_counter()
+                        for chunk in self.chains[chain].stream(inputs):
+                            if chunk.content:
+                                if not started:
+                                    metrics.observe(f"llm_{chain}_first_token", time.perf_counter() - start)
+                                started = True
+                                yield chunk.content
+                    return
+                finally:
+                    backpressure.LLM.release(ticket)
+            except self.retryable as e:
+                if started or attempt == config.OLLAMA_RETRIES or not self._should_retry(e):
+                    raise
+                self._backoff(attempt, e)
+
+    def preload(self):
+        """Load the model into Ollama's memory so the first question doesn't pay for it."""
+        self.client.generate(model=config.OLLAMA_MODEL, prompt="", keep_alive=config.OLLAMA_KEEP_ALIVE)
+
+
+def get_gateway():
+    return registry.get_model("llm_gateway", LLMGateway)
 
-        chain = prompt_extract | self.llm
 
-        result = chain.invoke({
+class get_result:
+    def __init__(self):
+        # Cheap per call: the client, model handle and chains are shared process-wide.
+        self.gateway = get_gateway()
+        self.client = self.gateway.client
+        self.llm = self.gateway.llm
+
+    # ==========================================================
+    # MAIN QA / RAG RESPONSE
+    # ==========================================================
+    def extract_result(self, text, query, recent_history, references_for_each_chunk):
+        return self.gateway.invoke("extract", {
             "text_chunks": text,
             "query": query,
             "recent_history": recent_history,
             "references_for_each_chunk": references_for_each_chunk
         })
 
-        return result.content
+    def stream_result(self, text, query, recent_history, references_for_each_chunk):
+        # Same prompt as extract_result, yielding tokens as Ollama produces them.
+        return self.gateway.stream("extract", {
+            "text_chunks": text,
+            "query": query,
+            "recent_history": recent_history,
+            "references_for_each_chunk": references_for_each_chunk
+        })
 
     # ==========================================================
     # STABLE DIFFUSION IMAGE GENERATION
     # ==========================================================
-    def call_stable_diffusion(self, summary):
-        model_id = "runwayml/stable-diffusion-v1-5"
-
-        pipe = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            torch_dtype=torch.float16
-        )
-        pipe = pipe.to("cuda")
+    def load_stable_diffusion(self):
+        def load():
+            if not config.ENABLE_IMAGE_GENERATION:
+                raise RuntimeError("Image generation is disabled (ENABLE_IMAGE_GENERATION=0)")
+            import torch
+            from diffusers import StableDiffusionPipeline
+
+            cuda = torch.cuda.is_available()
+            pipe = StableDiffusionPipeline.from_pretrained(
+                config.SD_MODEL,
+                torch_dtype=torch.float16 if cuda else torch.float32
+            )
+            pipe = pipe.to("cuda" if cuda else "cpu")
+            if not cuda:
+                pipe.enable_attention_slicing()
+            return pipe
+
+        return registry.get_model("stable_diffusion", load)
 
-        image = pipe(summary).images[0]
-        image.save("generated_image.png")
+    def call_stable_diffusion(self, summary):
+        pipe = self.load_stable_diffusion()
+
+        with metrics.span("image_generation"):
+            if pipe.device.type == "cuda":
+                image = pipe(summary).images[0]
+            else:
+                # CPU mode: fewer denoising steps and a smaller canvas.
+                size = config.SD_CPU_RESOLUTION
+                image = pipe(
+                    summary,
+                    num_inference_steps=config.SD_CPU_STEPS,
+                    height=size,
+                    width=size
+                ).images[0]
 
         return image
 
@@ -86,59 +260,27 @@ class get_result:
     # SHORT ACADEMIC SUMMARY (LLaMA)
     # ==========================================================
     def llama_summarize(self, text, max_words=120):
-        prompt = PromptTemplate.from_template(
-            """
-            You are an academic disaster management expert.
-
-            Summarize the following text:
-            - Preserve technical accuracy
-            - Keep cause–effect relationships
-            - Maximum {max_words} words
-            - No preamble
-
-            ### Text:
-            {text}
+        return self.gateway.invoke("summarize", {"text": text, "max_words": max_words})
 
-            ### Summary:
-            """
-        )
-
-        chain = prompt | self.llm
-        result = chain.invoke({"text": text, "max_words": max_words})
-        return result.content
+    # ==========================================================
+    # ROLLING CONVERSATION SUMMARY
+    # ==========================================================
+    def update_conversation_summary(self, summary, turns, max_words=150):
+        result = self.gateway.invoke("conversation_summary", {
+            "summary": summary or "(empty)",
+            "turns": "\n\n".join(f"User: {turn['user']}\nAssistant: {turn['bot']}" for turn in turns),
+            "max_words": max_words
+        })
+        return result.strip()
 
     # ==========================================================
     # LONG TEXT SUMMARY (MAP–REDUCE STYLE)
     # ==========================================================
-    def extract_result_4(self, text, chunk_size=1400):
-
-        def chunk_text(text, size):
-            words = text.split()
-            return [
-                " ".join(words[i:i + size])
-                for i in range(0, len(words), size)
-            ]
+    def combine_summaries(self, summaries):
+        return self.gateway.invoke("combine", {"summaries": summaries})
 
-        chunks = chunk_text(text, chunk_size)
-
-        partial_summaries = []
-        for chunk in chunks:
-            summary = self.llama_summarize(chunk, max_words=120)
-            partial_summaries.append(summary)
-
-        final_prompt = PromptTemplate.from_template(
-            """
-            Combine the following summaries into one coherent academic summary.
-            Remove redundancy and improve logical flow.
-
-            ### Summaries:
-            {summaries}
-
-            ### Final Summary:
-            """
-        )
-
-        chain = final_prompt | self.llm
-        result = chain.invoke({"summaries": "\n".join(partial_summaries)})
+    def extract_result_4(self, text, chunk_size=1400):
+        # Parallel, cached map-reduce lives in summarizer (it imports this module).
+        import summarizer
 
-        return result.content
+        return summarizer.summarize(text, chunk_words=chunk_size)["summary"]
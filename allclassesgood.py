@@ -1,170 +1,176 @@
-import chromadb
 from LLM import get_result
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import PyPDF2
+import answer_cache
+import config
+import context_packer
+import embeddings
+import registry
 import chunk_with_references
-from docx import Document  
-import pandas as pd
-import io
-from tqdm import tqdm
+import document_parser
+import logging
+import time
+import metrics
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 class Chroma:
     def __init__(self, mode):
-        self.chroma_client = chromadb.PersistentClient(path="./chroma_local_db")  # Local storage
-        self.collection = self.chroma_client.get_or_create_collection(name="disaster_papers_pakistan")
-        print("Processed in pakistan mode")
-        if mode == "internet":
-            self.collection = self.chroma_client.get_or_create_collection(name="disaster_papers_internet")
-            print("Processed in internet mode")
-        elif mode == "hybrid":
-            self.collection = self.chroma_client.get_or_create_collection(name="disaster_papers_hybrid")
-            print("Processed in hybrid mode")
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        # Model, client and collection handles are shared process-wide.
+        self.mode = mode
+        self.collection_name = registry.collection_name_for_mode(mode)
+        self.chroma_client = registry.get_chroma_client()
+        self.collection = registry.get_collection(self.collection_name)
+        self.embedding_model = registry.get_embedding_model()
         
     def extract_references_from_text(self,full_text):
-            keywords = ["References", "REFERENCES", "references"]
-            start = -1
-            for keyword in keywords:
-                start = full_text.find(keyword)
-                if start != -1:
-                    break
-            if start != -1:
-                return full_text[start:]#.split("\n")
-            return ""
+        return document_parser.extract_references_from_text(full_text)
     
     def read_pdf(self, file):
-        
-        reader = PyPDF2.PdfReader(file)
-        pages = []
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            pages.append(page.extract_text())
-        
-        whole_text = " "
-        for text in pages:
-            whole_text += text
-        ref_lines = self.extract_references_from_text(whole_text)
-        references = ref_lines
-        self.text = whole_text
+        self.text, references = document_parser.read_pdf(document_parser.read_bytes(file))
         return self.text, references
     
     def read_txt(self, file):
-        
-        file.seek(0)
-        raw_data = file.read()
-
-        for encoding in ["utf-8", "latin-1", "windows-1252"]:
-            try:
-                full_text = raw_data.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            raise ValueError("Unable to decode text file.")
-
-        references = self.extract_references_from_text(full_text)
-        self.text = full_text
+        self.text, references = document_parser.read_txt(document_parser.read_bytes(file))
         return self.text, references
 
-
     def read_docx(self, file):
-        
-        doc = Document(file)
-        paragraphs = [para.text for para in doc.paragraphs]
-        
-        # ✅ Join list of paragraphs into a string
-        full_text = "\n".join(paragraphs)
-
-        references = self.extract_references_from_text(full_text)  # Now it's a string
-        self.text = full_text
+        self.text, references = document_parser.read_docx(document_parser.read_bytes(file))
         return self.text, references
     
     def convert_to_csv(self, file):
-        filename = file.filename
-        ext = filename.rsplit('.', 1)[1].lower()
-
-        if ext == 'csv':
-            file.seek(0)
-            df = pd.read_csv(file)
-        elif ext in ['xls', 'xlsx']:
-            df = pd.read_excel(file)
-        else:
-            raise ValueError("Unsupported spreadsheet format")
-
-        # Convert to CSV string (no index column)
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_data = csv_buffer.getvalue()
-
-        self.text = csv_data
-        return self.text, []
-        
+        self.text, references = document_parser.read_spreadsheet(file.filename, document_parser.read_bytes(file))
+        return self.text, references
+
+    def read_file(self, file):
+        with metrics.span("parse"):
+            return document_parser.parse_file(file.filename, document_parser.read_bytes(file))
 
     def read_files(self):
         self.all_files = []
         self.all_references = []
         for file in self.files:
-            ext = file.filename.rsplit('.', 1)[1].lower()
-            if ext == 'pdf':
-                output, references =self.read_pdf(file)
-                self.all_files.append(output)
-                self.all_references.append(references)
-
-            elif ext == 'txt':
-                output, references = self.read_txt(file)
-                self.all_files.append(output)
-                self.all_references.append(references)  
-
-            elif ext == 'docx':
-                output, references = self.read_docx(file)
-                self.all_files.append(output)
-                self.all_references.append(references)
-            elif ext in ['csv', 'xls', 'xlsx']:
-                output, references = self.convert_to_csv(file)
-                self.all_files.append(output)
-                self.all_references.append(references)
-            else:
-                return "Unsupported file type"
+            output, references = self.read_file(file)
+            self.all_files.append(output)
+            self.all_references.append(references)
             
         return self.all_files, self.all_references
     
-    def insert_docs(self):
+    def insert_text(self, text, references, progress=None):
+        """Chunk, embed and store one parsed document. `progress(stage, **counts)` is called per stage."""
+        progress = progress or (lambda stage, **counts: None)
+
+        progress("chunking")
+        with metrics.span("chunk"):
+            chunks = self.create_insert_chunks(text)
+            all_chunks = chunk_with_references.get_references([chunks], [references])
+
+        progress("embedding", chunks=len(all_chunks))
+        return self.store_chunks(all_chunks, progress=progress)
+
+    def insert_docs(self, progress=None):
+        # Files are parsed in parallel; each one is chunked and stored as soon
+        # as its text is ready while the others are still being parsed.
+        totals = {"files": 0, "chunks": 0, "skipped": 0, "reused": 0, "embedded": 0, "seconds": 0.0}
+        for index, text, references, error in document_parser.parse_files(self.files):
+            if error is not None:
+                raise error
+            stats = self.insert_text(text, references, progress)
+            totals["files"] += 1
+            for key in ("chunks", "skipped", "reused", "embedded", "seconds"):
+                totals[key] += stats[key]
+
+        totals["chunks_per_sec"] = round(totals["chunks"] / totals["seconds"], 1) if totals["seconds"] else 0.0
+        logger.info("Stored %d files (%d chunks) in local ChromaDB", totals["files"], totals["chunks"])
+        return totals
+        
+    def store_chunks(self, all_chunks, batch_size=None, progress=None):
+        # Every chunk goes to the mode collection and to the hybrid collection.
+        # Chunk IDs are content hashes, so chunks already stored are skipped
+        # and known embeddings are reused instead of re-encoded.
+        batch_size = batch_size or config.INGEST_BATCH_SIZE
+        names = {self.collection_name, registry.COLLECTIONS["hybrid"]}
+        collections = [registry.get_collection(name) for name in names]
+
+        unique = {}
+        for doc in all_chunks:
+            unique.setdefault(doc["id"], doc)
+        all_chunks = list(unique.values())
+
+        counts = {"skipped": 0, "reused": 0, "embedded": 0}
+        written = False
+        start = time.time()
         try:
-            all_documents, all_references = self.read_files()
-            doc_chunks = []
+            for i in range(0, len(all_chunks), batch_size):
+                logger.debug("Storing chunks %d-%d of %d", i, min(i + batch_size, len(all_chunks)), len(all_chunks))
+                batch = all_chunks[i:i + batch_size]
+                ids = [doc["id"] for doc in batch]
+
+                known = {}
+                stored = []
+                for collection in collections:
+                    existing = collection.get(ids=ids, include=["embeddings"])
+                    for id_, embedding in zip(existing["ids"], existing["embeddings"]):
+                        known[id_] = np.asarray(embedding).tolist()
+                    stored.append(set(existing["ids"]))
+
+                pending = [doc for doc in batch if not all(doc["id"] in ids_ for ids_ in stored)]
+                counts["skipped"] += len(batch) - len(pending)
+                if not pending:
+                    continue
+
+                if progress:
+                    progress("embedding", processed=i, **counts)
+                for doc in pending:
+                    if doc["id"] not in known:
+                        cached = embeddings.cache.get(doc["id"])
+                        if cached is not None:
+                            known[doc["id"]] = cached
+                counts["reused"] += sum(1 for doc in pending if doc["id"] in known)
+
+                missing = [doc for doc in pending if doc["id"] not in known]
+                if missing:
+                    with metrics.span("embed"):
+                        vectors = embeddings.service.encode([doc["text"] for doc in missing], embeddings.BULK).tolist()
+                    for doc, vector in zip(missing, vectors):
+                        known[doc["id"]] = vector
+                        embeddings.cache.put(doc["id"], vector)
+                    counts["embedded"] += len(missing)
+
+                if progress:
+                    progress("writing", processed=i, **counts)
+                for collection, stored_ids in zip(collections, stored):
+                    new = [doc for doc in pending if doc["id"] not in stored_ids]
+                    if not new:
+                        continue
+                    written = True
+                    with metrics.span("vector_write"):
+                        collection.upsert(
+                            ids=[doc["id"] for doc in new],
+                            documents=[doc["text"] for doc in new],
+                            embeddings=[known[doc["id"]] for doc in new],
+                            metadatas=[{"references": str(doc["metadata"]["cited_references"])} for doc in new]
+                        )
+        finally:
+            # Cached answers for these collections are now stale.
+            if written:
+                for name in names:
+                    answer_cache.cache.invalidate(name)
+
+        elapsed = time.time() - start
+        stats = {
+            "chunks": len(all_chunks),
+            **counts,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(all_chunks) / elapsed, 1) if elapsed else 0.0
+        }
+        logger.info("Stored %d chunks in %ss (%s chunks/sec): %d already stored, %d reused, %d newly embedded",
+                    stats['chunks'], stats['seconds'], stats['chunks_per_sec'],
+                    stats['skipped'], stats['reused'], stats['embedded'])
+        return stats
 
-            for i,doc in enumerate(all_documents):
-                temp_chunks = self.create_insert_chunks(doc)
-                doc_chunks.append(temp_chunks)
-            
-            all_chunks = chunk_with_references.get_references(doc_chunks, all_references)
-            collection = self.chroma_client.get_or_create_collection(name="disaster_papers_hybrid")
-            
-            for i, doc in tqdm(enumerate(all_chunks)):
-                self.embeddings = self.embedding_model.encode(doc["text"]).tolist()
-                doc["metadata"]["cited_references"] = {"references":str(doc["metadata"]["cited_references"])}
-                
-                self.collection.add(
-                    ids=[doc["id"]], 
-                    documents=[doc["text"]],  
-                    embeddings=[self.embeddings],
-                    metadatas= [doc["metadata"]["cited_references"]] )
-
-                collection.add(
-                    ids=[doc["id"]], 
-                    documents=[doc["text"]],  
-                    embeddings=[self.embeddings],
-                    metadatas= [doc["metadata"]["cited_references"]] )
-                
-            print("Documents stored successfully in local ChromaDB.")
-            
-        except Exception as e:
-            print("Exception occured: ",e)
-        
-        
     def create_insert_chunks(self, text):
-        
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=600,
             chunk_overlap=100,
@@ -175,6 +181,8 @@ class Chroma:
         return chunks
     
     def create_chunks(self, text):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         r_splitter = RecursiveCharacterTextSplitter(
             separators= ["\n\n", "\n", "."],
             chunk_size = 1200,
@@ -187,15 +195,40 @@ class Chroma:
     def count_tokens(self,text):
         return len(text.split())  # Rough token estimate
 
-    def search_documents(self, query):
-        query_embedding = self.embedding_model.encode(query).tolist()
-        results = self.collection.query(query_embeddings=[query_embedding], n_results=10)
+    def embed_query(self, query):
+        # Batched with other requests' queries, ahead of any ingestion work.
+        with metrics.span("query_embed"):
+            return embeddings.service.encode_one(query).tolist()
+
+    def search_documents(self, query, query_embedding=None):
+        """Retrieve candidates, then pack the least redundant ones into the context budget."""
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        with metrics.span("vector_query"):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=config.CONTEXT_CANDIDATES,
+                include=["documents", "metadatas", "embeddings"]
+            )
         self.retrieved_docs = results["documents"]
-        metadatas = results["metadatas"]
-        full_context = results["documents"]
-        self.context = full_context
-        return self.context, metadatas
+        candidate_embeddings = results.get("embeddings")
+        with metrics.span("prompt_build"):
+            chunks, references, stats = context_packer.pack(
+                query_embedding,
+                results["documents"][0],
+                candidate_embeddings[0] if candidate_embeddings is not None else None,
+                results["metadatas"][0]
+            )
+        self.context_stats = stats
+        logger.info("Packed %d/%d chunks with %d references: ~%d prompt tokens instead of ~%d (%s ms)",
+                    stats['packed'], stats['candidates'], stats['references'],
+                    stats['tokens'], stats['candidate_tokens'], stats['pack_ms'])
+        self.context = chunks
+        return self.context, references
     
     def call_llm(self,context1, query, recent_history, ref):
         extract_result = get_result().extract_result(text = context1, query=query, recent_history= recent_history, references_for_each_chunk=ref)
         return extract_result
+
+    def stream_llm(self, context1, query, recent_history, ref):
+        return get_result().stream_result(text = context1, query=query, recent_history= recent_history, references_for_each_chunk=ref)
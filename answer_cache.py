@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+
+class SemanticCache:
+    """Answers to recent queries, looked up by cosine similarity of the query embedding.
+
+    Entries are kept per collection, evicted LRU beyond `max_entries` and after
+    `ttl` seconds, and dropped wholesale when the collection's documents change.
+    """
+
+    def __init__(self, threshold, max_entries, ttl):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def version(self, collection):
+        return self._versions.get(collection, 0)
+
+    def lookup(self, collection, embedding):
+        """Return the cached entry for the closest earlier query, or None."""
+        query = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(collection)
+            if entries:
+                for key in [k for k, e in entries.items() if now - e['created'] > self.ttl]:
+                    del entries[key]
+            if not entries:
+                self.misses += 1
+                return None
+
+            keys = list(entries)
+            scores = np.stack([entries[k]['embedding'] for k in keys]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = entries[keys[best]]
+            entries.move_to_end(keys[best])
+            self.hits += 1
+            self.saved_seconds += entry['latency']
+            return entry
+
+    def store(self, collection, embedding, answer, sources, latency, version):
+        """Cache `answer`; ignored if the collection changed since `version` was read."""
+        with self._lock:
+            if self._versions.get(collection, 0) != version:
+                return
+            entries = self._entries.setdefault(collection, OrderedDict())
+            entries[self._next_id] = {
+                'embedding': self._normalize(embedding),
+                'answer': answer,
+                'sources': sources,
+                'latency': latency,
+                'created': time.time()
+            }
+            self._next_id += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, collection):
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+            self._entries.pop(collection, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'entries': {name: len(entries) for name, entries in self._entries.items()}
+            }
+
+
+cache = SemanticCache(
+    threshold=config.ANSWER_CACHE_THRESHOLD,
+    max_entries=config.ANSWER_CACHE_SIZE,
+    ttl=config.ANSWER_CACHE_TTL
+)
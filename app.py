@@ -1,66 +1,189 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, g, send_file
+import logging
 import time
+import json
 import base64
 import os
 import secrets
-from newmain import newfunc  
+import threading
+import uuid
+from newmain import newfunc, save_brief
+import backpressure
+import config
+import LLM
+import metrics
+import registry
+import voicetotext
+import image_jobs
+import image_store
+import answer_cache
+import audio_sessions
+import conversation_store
+import conversation_memory
+import embeddings
+import ingestion_jobs
+import singleflight
+import summarizer
+
+metrics.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'your-very-secret-key'  # Needed for Flask sessions
 
+# Cache lifetime (one year) for content-addressed responses.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
 # File upload configuration
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Load the embedding model, vector DB and Whisper once per worker, off the request path.
+def warm_up():
+    registry.warm_up()
+    if config.ENABLE_SPEECH:
+        voicetotext.get_model()
+    try:
+        LLM.get_gateway().preload()
+    except Exception as e:
+        logger.warning("Could not preload the LLM: %s", e)
+
+
+# Parser pool workers (spawned) re-import this module as __mp_main__ when the
+# app is started with `python app.py`; they must not load the models.
+if config.WARM_UP_ON_START and __name__ != '__mp_main__':
+    threading.Thread(target=warm_up, daemon=True).start()
+
+
+store = conversation_store.create_store()
+# Images finish in the background; attach them to the messages that asked for them.
+image_jobs.add_listener(store.set_image)
+
+
+@app.before_request
+def start_request():
+    # Reuse the caller's request ID (e.g. from a proxy) so logs line up end to end.
+    metrics.set_request_id(request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12])
+    backpressure.set_interactive(True)
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def finish_request(response):
+    response.headers['X-Request-ID'] = metrics.get_request_id()
+    start = g.get('request_start')
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint or 'unknown',
+                                        request.method, str(response.status_code))
+    return response
+
+
+@app.errorhandler(backpressure.Overloaded)
+def overloaded(error):
+    # Turned away right away instead of queueing until the client times out.
+    response = jsonify({'error': str(error), 'backend': error.backend})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def current_user_id():
+    # The session only identifies the user; history lives in the store.
+    if 'user_id' not in session:
+        session['user_id'] = secrets.token_hex(16)
+    return session['user_id']
+
 
 def clean_history(conversation_id):
-    conversations = session.get('conversations', {})
-    if conversation_id not in conversations:
-        return []
-    return [
-        {k: v for k, v in entry.items() if k != 'image'}
-        for entry in conversations[conversation_id]['history'][-3:]
-    ]
+    # Rolling summary plus the last exchange, so the prompt stays bounded.
+    return conversation_memory.history(store, current_user_id(), conversation_id)
 
-def conversations(conv_id, user_message, mode, type, generate_image=False):
-    if 'conversations' not in session:
-        session['conversations'] = {}
-
-    conversations = session['conversations']
-
-    if conv_id not in conversations:
-        title = user_message[:30] if type == "normal" else "Audio_" + user_message[:25]
-        conversations[conv_id] = {
-            'title': title,
-            'history': [],
-            'last_updated': time.time(),
-            'mode': mode
-        }
-
-    message_entry = {
-        'user': user_message,
-        'timestamp': time.time()
-    }
+def add_user_message(conv_id, user_message, mode, type, generate_image=False):
+    # Refuse before anything is stored if a backend this turn needs is saturated.
+    backpressure.LLM.check()
+    if generate_image and config.ENABLE_IMAGE_GENERATION:
+        backpressure.IMAGE.check()
+
+    user_id = current_user_id()
+    title = user_message[:30] if type == "normal" else "Audio_" + user_message[:25]
+    store.create_conversation(user_id, conv_id, title, mode)
+
+    # The image is rendered in the background; the client polls /api/image_job.
+    image_job = image_jobs.submit(user_message) if generate_image and config.ENABLE_IMAGE_GENERATION else None
+    message_id = store.add_message(user_id, conv_id, user_message, user_message[:30], image_job)
+
+    if image_job:
+        job = image_jobs.get_job(image_job)
+        if job and job['status'] == 'done':
+            store.set_image(image_job, job['image'])
 
-    conversations[conv_id]['history'].append(message_entry)
+    return message_id, image_job
+
+
+def new_conversation_id():
+    return str(int(time.time() * 1000))
+
+
+def conversations(conv_id, user_message, mode, type, generate_image=False):
+    conv_id = conv_id or new_conversation_id()
+    message_id, image_job = add_user_message(conv_id, user_message, mode, type, generate_image)
     cleaned_history = clean_history(conv_id)
 
     bot_response = newfunc(user_message, "search", mode=mode, chat_history=cleaned_history)
-    conversations[conv_id]['history'][-1]['bot'] = bot_response
-    conversations[conv_id]['last_updated'] = time.time()
+    store.set_bot_response(message_id, bot_response)
+    conversation_memory.remember(store, current_user_id(), conv_id)
+    return conv_id, image_job, bot_response
 
-    image_base64 = None
-    if generate_image:
-        image_base64 = newfunc(user_text=user_message, action="image", mode=mode, chat_history=cleaned_history)
-        if image_base64:
-            conversations[conv_id]['history'][-1]['image'] = image_base64
 
-    if len(conversations[conv_id]['history']) == 1:
-        conversations[conv_id]['title'] = user_message[:30]
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    session['conversations'] = conversations
-    return conv_id, image_base64, bot_response
+
+def stream_conversation(conv_id, user_message, mode, type, generate_image=False, transcript=False):
+    conv_id = conv_id or new_conversation_id()
+    message_id, image_job = add_user_message(conv_id, user_message, mode, type, generate_image)
+    cleaned_history = clean_history(conv_id)
+    user_id = current_user_id()
+    request_id = metrics.get_request_id()
+
+    def generate():
+        metrics.set_request_id(request_id)
+        if transcript:
+            yield sse('transcript', {'user_message': user_message})
+
+        parts = []
+        try:
+            sources, tokens = newfunc(user_message, "stream", mode=mode, chat_history=cleaned_history)
+            yield sse('sources', {'sources': sources})
+            for token in tokens:
+                parts.append(token)
+                yield sse('token', {'token': token})
+        except Exception as e:
+            yield sse('error', {'error': str(e)})
+            return
+
+        bot_response = "".join(parts)
+        save_brief(bot_response)
+        store.set_bot_response(message_id, bot_response)
+        conversation_memory.remember(store, user_id, conv_id)
+
+        yield sse('done', {
+            'conversation_id': conv_id,
+            'mode': mode,
+            'image_job': image_job
+        })
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def conditional_json(payload):
+    # Clients revalidate with If-None-Match and get an empty 304 when nothing changed.
+    response = jsonify(payload)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 @app.route('/')
@@ -68,6 +191,30 @@ def home():
     return render_template('index.html')
 
 
+@app.route('/api/health', methods=['GET'])
+def health():
+    status = registry.status()
+    status['features'] = {
+        'image_generation': config.ENABLE_IMAGE_GENERATION,
+        'speech': config.ENABLE_SPEECH
+    }
+    status['backends'] = backpressure.status()
+    status['backends']['embedder'] = embeddings.service.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    stats = answer_cache.cache.stats()
+    stats['singleflight'] = singleflight.stats()
+    return jsonify(stats)
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.get_json()
@@ -79,7 +226,7 @@ def chat():
     if not user_message:
         return jsonify({'error': 'Empty message'}), 400
 
-    conv_id, image_base64, bot_response = conversations(
+    conv_id, image_job, bot_response = conversations(
         conv_id=conversation_id,
         user_message=user_message,
         mode=mode,
@@ -91,59 +238,168 @@ def chat():
         'response': bot_response,
         'conversation_id': conv_id,
         'mode': mode,
-        'image': image_base64
+        'image_job': image_job
     })
 
 
-@app.route("/chat-audio", methods=["POST"])
-def chat_audio():
-    data = request.get_json()
-    audio_base64 = data.get("audio")
-    conversation_id = data.get("conversation_id")
-    mode = data.get("mode", "general")
-    generate_image = data.get('generate_image', False)
+def read_audio_request():
+    """Audio bytes (or None) and the chat fields of an audio request.
 
-    if not audio_base64:
-        return jsonify({"message": "No audio provided"}), 400
+    Multipart forms carry the recording as the binary `audio` file, or name a
+    chunked upload with `session_id`. JSON bodies with base64 `audio` still work.
+    """
+    if request.is_json:
+        fields = request.get_json()
+        audio = fields.get("audio")
+        return (base64.b64decode(audio) if audio else None), fields
+    file = request.files.get("audio")
+    return (file.read() if file else None), request.form
 
-    audio_data = base64.b64decode(audio_base64)
-    data_uri = f"data:audio/wav;base64,{audio_base64}"
-    cleaned_history = clean_history(conversation_id)
 
-    user_message = newfunc(audio_data, "audio", mode=mode, chat_history=cleaned_history, path=audio_base64)
+def is_true(value):
+    return value in (True, "true", "1", "on")
 
-    conv_id, image_base64, bot_response = conversations(
-        conv_id=conversation_id,
+
+def transcribe_request(audio, fields):
+    """The transcript of an audio request, or None if its upload session is unknown."""
+    session_id = fields.get("session_id")
+    if session_id:
+        # Most of the recording was transcribed while it was being uploaded.
+        return audio_sessions.finish(session_id, current_user_id())
+    return newfunc(audio, "audio", mode=fields.get("mode", "general"), chat_history=[])
+
+
+@app.route("/api/audio", methods=["POST"])
+def start_audio_upload():
+    """Open an upload session; the recording is then PUT chunk by chunk while it is made."""
+    if not config.ENABLE_SPEECH:
+        return jsonify({"message": "Speech input is disabled"}), 503
+    return jsonify({"session_id": audio_sessions.create(current_user_id())}), 201
+
+
+@app.route("/api/audio/<session_id>/<int:seq>", methods=["PUT"])
+def upload_audio_chunk(session_id, seq):
+    try:
+        found = audio_sessions.append(session_id, current_user_id(), seq, request.get_data())
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if not found:
+        return jsonify({"message": "Audio session not found"}), 404
+
+    return "", 204
+
+
+@app.route("/chat-audio", methods=["POST"])
+def chat_audio():
+    if not config.ENABLE_SPEECH:
+        return jsonify({"message": "Speech input is disabled"}), 503
+    audio, fields = read_audio_request()
+    if audio is None and not fields.get("session_id"):
+        return jsonify({"message": "No audio provided"}), 400
+    backpressure.LLM.check()  # don't transcribe a question that can't be answered
+    backpressure.TRANSCRIBER.check()
+
+    user_message = transcribe_request(audio, fields)
+    if user_message is None:
+        return jsonify({"message": "Audio session not found"}), 404
+    if not user_message.strip():
+        # Silence (or nothing intelligible) is not a question worth sending to the LLM.
+        return jsonify({"message": "No speech detected"}), 400
+
+    conv_id, image_job, bot_response = conversations(
+        conv_id=fields.get("conversation_id"),
         user_message=user_message,
-        mode=mode,
+        mode=fields.get("mode", "general"),
         type="normal",
-        generate_image=generate_image
+        generate_image=is_true(fields.get("generate_image"))
     )
 
     return jsonify({
         "reply": bot_response,
         "conversation_id": conv_id,
-        "audio_base64": data_uri,
         "user_message": user_message,
-        'image': image_base64
+        'image_job': image_job
     })
 
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json()
+    user_message = data.get('message')
+    conversation_id = data.get('conversation_id')
+    mode = data.get('mode', 'general')
+    generate_image = data.get('generate_image', False)
+
+    if not user_message:
+        return jsonify({'error': 'Empty message'}), 400
+
+    return stream_conversation(
+        conv_id=conversation_id,
+        user_message=user_message,
+        mode=mode,
+        type="normal",
+        generate_image=generate_image
+    )
+
+
+@app.route("/chat-audio/stream", methods=["POST"])
+def chat_audio_stream():
+    if not config.ENABLE_SPEECH:
+        return jsonify({"message": "Speech input is disabled"}), 503
+    audio, fields = read_audio_request()
+    if audio is None and not fields.get("session_id"):
+        return jsonify({"message": "No audio provided"}), 400
+    backpressure.LLM.check()  # don't transcribe a question that can't be answered
+    backpressure.TRANSCRIBER.check()
+
+    user_message = transcribe_request(audio, fields)
+    if user_message is None:
+        return jsonify({"message": "Audio session not found"}), 404
+    if not user_message.strip():
+        # Silence (or nothing intelligible) is not a question worth sending to the LLM.
+        return jsonify({"message": "No speech detected"}), 400
+
+    return stream_conversation(
+        conv_id=fields.get("conversation_id"),
+        user_message=user_message,
+        mode=fields.get("mode", "general"),
+        type="normal",
+        generate_image=is_true(fields.get("generate_image")),
+        transcript=True
+    )
+
+
+@app.route('/api/image_job/<job_id>', methods=['GET'])
+def image_job_status(job_id):
+    job = image_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
+
+@app.route('/images/<digest>.png', methods=['GET'])
+@app.route('/images/<digest>/<int:size>.png', methods=['GET'])
+def generated_image(digest, size=None):
+    path = image_store.path(digest, size)
+    if path is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    # Named by content hash: the bytes behind a URL never change.
+    response = send_file(path, mimetype='image/png', etag=digest if size is None else f"{digest}-{size}",
+                         max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/api/new_chat', methods=['POST'])
 def new_chat():
     data = request.get_json()
     mode = data.get('mode', 'general')
 
-    if 'conversations' not in session:
-        session['conversations'] = {}
-
-    conversation_id = str(int(time.time() * 1000))
-    session['conversations'][conversation_id] = {
-        'title': 'New Chat',
-        'history': [],
-        'last_updated': time.time(),
-        'mode': mode
-    }
+    conversation_id = new_conversation_id()
+    store.create_conversation(current_user_id(), conversation_id, 'New Chat', mode)
 
     return jsonify({
         'status': 'success',
@@ -156,34 +412,114 @@ def new_chat():
 def upload_file():
     files = request.files.getlist('files')
     names = [file.filename for file in files]
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
 
-    try:
-        newfunc('message', "insert", mode=request.form.get('mode'), chat_history=[], files=files)
-        return jsonify({
-            'status': 'success',
-            'message': f'File(s) {names} processed successfully',
-            'filename': names
-        })
+    job_id = ingestion_jobs.submit(files, mode=request.form.get('mode'))
+    return jsonify({
+        'status': 'queued',
+        'message': f'File(s) {names} queued for processing',
+        'filename': names,
+        'job_id': job_id
+    }), 202
 
-    except Exception as e:
-        return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+
+@app.route('/api/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    job = ingestion_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
+
+@app.route('/api/summarize', methods=['POST'])
+def summarize_document():
+    """Summarize pasted text or one uploaded document in the background."""
+    file = request.files.get('file')
+    if file is not None:
+        job_id = summarizer.submit(filename=file.filename, data=file.read())
+    else:
+        data = request.get_json(silent=True) or {}
+        text = data.get('text')
+        if not text:
+            return jsonify({'error': 'No text or file provided'}), 400
+        job_id = summarizer.submit(text=text)
+
+    return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+
+@app.route('/api/summarize/<job_id>', methods=['GET'])
+def summarize_status(job_id):
+    job = summarizer.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
+
+def page_limit(default, maximum):
+    # Out-of-range values are clamped; a SQLite LIMIT below 1 would mean "no limit" or an empty page.
+    return max(1, min(request.args.get('limit', default, type=int), maximum))
 
 
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
-    return jsonify({'conversations': session.get('conversations', {})})
+    """Conversation IDs, titles and timestamps only, newest first, with cursor pagination."""
+    user_id = current_user_id()
+    limit = page_limit(50, 200)
+    since = request.args.get('since', type=float)
+    cursor = request.args.get('cursor')
+    before = None
+    if cursor:
+        last_updated, separator, conversation_id = cursor.partition('|')
+        try:
+            before = (float(last_updated), conversation_id)
+        except ValueError:
+            separator = None
+        if not separator or not conversation_id:
+            return jsonify({'error': 'Malformed cursor'}), 400
+
+    conversations = store.list_conversations(user_id, limit=limit, before=before, since=since)
+    next_cursor = None
+    if len(conversations) == limit:
+        last = conversations[-1]
+        next_cursor = f"{last['last_updated']}|{last['id']}"
+
+    return conditional_json({'conversations': conversations, 'next_cursor': next_cursor})
+
+
+@app.route('/api/conversations/<conversation_id>/messages', methods=['GET'])
+def get_conversation_messages(conversation_id):
+    user_id = current_user_id()
+    conversation = store.get_conversation(user_id, conversation_id)
+    if conversation is None:
+        return jsonify({'error': 'Conversation not found'}), 404
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = page_limit(100, 500)
+    messages = store.get_messages(user_id, conversation_id, offset=offset, limit=limit)
+    total = store.count_messages(user_id, conversation_id)
+
+    return conditional_json({
+        'conversation': conversation,
+        'messages': messages,
+        'offset': offset,
+        'total': total,
+        'next_offset': offset + len(messages) if offset + len(messages) < total else None
+    })
 
 
 @app.route('/api/current_conversation', methods=['GET'])
 def get_current_conversation():
-    conversations = session.get('conversations', {})
-    if not conversations:
+    user_id = current_user_id()
+    latest_id = store.latest_conversation_id(user_id)
+    if latest_id is None:
         return jsonify({'error': 'No conversations'}), 404
 
-    latest_id = max(conversations.keys(), key=lambda k: conversations[k]['last_updated'])
     return jsonify({
         'conversation_id': latest_id,
-        'conversation': conversations[latest_id]
+        'conversation': store.get_conversation(user_id, latest_id)
     })
 
 
@@ -193,10 +529,7 @@ def delete_chat():
     if not conversation_id:
         return jsonify({'error': 'Missing conversation ID'}), 400
 
-    conversations = session.get('conversations', {})
-    if conversation_id in conversations:
-        del conversations[conversation_id]
-        session['conversations'] = conversations
+    if store.delete_conversation(current_user_id(), conversation_id):
         return jsonify({'status': 'success', 'message': 'Chat deleted'})
 
     return jsonify({'error': 'Conversation not found'}), 404
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+import voicetotext
+
+logger = logging.getLogger(__name__)
+
+# Recordings are uploaded in chunks while the user is still speaking. Each
+# chunk is fed to a per-recording ffmpeg process as it arrives, and settled
+# stretches of speech are transcribed in the background, so when the recording
+# stops only the last few seconds are left to transcribe. The background
+# transcriptions yield the transcriber to requests (see backpressure.TRANSCRIBER).
+_executor = ThreadPoolExecutor(max_workers=config.AUDIO_WORKERS, thread_name_prefix="audio")
+_lock = threading.Lock()
+_sessions = {}
+# The newest audio may end mid-word (or mid-frame); it waits for the next chunk.
+TAIL_SECONDS = 1.0
+
+
+def _prune(now):
+    for session_id in [k for k, s in _sessions.items() if now - s['updated'] > config.AUDIO_SESSION_TTL]:
+        session = _sessions.pop(session_id)
+        session['finished'] = True
+        if session['decoder'] is not None:
+            session['decoder'].kill()
+
+
+def create(user_id):
+    """Start an upload session for one recording and return its ID."""
+    now = time.time()
+    session = {
+        'id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'decoder': None,  # started with the first chunk
+        'received': 0,
+        'next_seq': 0,
+        'offset': 0,  # samples already transcribed
+        'segments': [],
+        'scheduled': False,
+        'finished': False,
+        'updated': now,
+        'request_id': metrics.get_request_id(),
+        # Chunks are fed to the decoder one at a time, in order.
+        'feeding': threading.Lock(),
+        # Held while transcribing so pieces are transcribed in order, once.
+        'transcribing': threading.Lock()
+    }
+    with _lock:
+        _prune(now)
+        _sessions[session['id']] = session
+    return session['id']
+
+
+def _get(session_id, user_id):
+    session = _sessions.get(session_id)
+    if session is None or session['user_id'] != user_id:
+        return None
+    return session
+
+
+def _advance(session, final=False):
+    with session['transcribing']:
+        decoder = session['decoder']
+        if decoder is None:
+            return
+        if final:
+            with metrics.span("audio_decode"):
+                audio = decoder.close()
+        else:
+            audio = decoder.audio()
+        start = session['offset']
+        end = len(audio)
+        if not final:
+            end -= int(TAIL_SECONDS * voicetotext.SAMPLE_RATE)
+            if end - start < config.AUDIO_SEGMENT_SECONDS * voicetotext.SAMPLE_RATE:
+                return
+            end = start + voicetotext.quietest_point(audio[start:end])
+        if end <= start:
+            return
+
+        text = voicetotext.transcribe(audio[start:end], prompt=" ".join(session['segments']) or None).strip()
+        if text:
+            session['segments'].append(text)
+        session['offset'] = end
+
+
+def _run(session):
+    metrics.set_request_id(session['request_id'])
+    with _lock:
+        session['scheduled'] = False
+        if session['finished']:
+            return
+    try:
+        _advance(session)
+    except Exception:
+        # Not fatal: finish() transcribes whatever is left from the last good cut.
+        logger.exception("Transcribing a recording in progress failed")
+
+
+def append(session_id, user_id, seq, data):
+    """Add chunk `seq` of a recording and transcribe ahead if enough new speech arrived.
+
+    Returns False for an unknown session. Raises ValueError for an out-of-order
+    chunk, undecodable audio or a recording over AUDIO_MAX_BYTES.
+    """
+    with _lock:
+        session = _get(session_id, user_id)
+    if session is None:
+        return False
+    with session['feeding']:
+        if session['finished']:
+            return False
+        if seq != session['next_seq']:
+            raise ValueError(f"Expected chunk {session['next_seq']}, got {seq}")
+        if session['received'] + len(data) > config.AUDIO_MAX_BYTES:
+            raise ValueError("Recording is too long")
+        try:
+            if session['decoder'] is None:
+                session['decoder'] = voicetotext.StreamDecoder()
+            session['decoder'].feed(data)
+        except RuntimeError as e:
+            raise ValueError(str(e)) from e
+        session['received'] += len(data)
+        session['next_seq'] += 1
+    with _lock:
+        session['updated'] = time.time()
+        schedule = not session['scheduled']
+        session['scheduled'] = True
+    if schedule:
+        _executor.submit(_run, session)
+    return True
+
+
+def finish(session_id, user_id):
+    """Transcribe the rest of the recording and return the full transcript (None if unknown).
+
+    The session is only dropped once that succeeds; if the last transcription
+    fails (e.g. the transcriber is busy), finishing it can be retried.
+    """
+    with _lock:
+        session = _get(session_id, user_id)
+    if session is None:
+        return None
+    with session['feeding']:
+        session['finished'] = True
+    _advance(session, final=True)
+    with _lock:
+        _sessions.pop(session_id, None)
+    return " ".join(session['segments'])
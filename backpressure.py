@@ -0,0 +1,165 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Each backend (LLM, transcriber, image generator) gets its own concurrency
+# limit and bounded wait queue, so a burst on one of them cannot tie up every
+# worker thread; the embedder bounds its own batch queue (embeddings.service).
+# Request threads are turned away as soon as the queue is full; background
+# jobs (ingestion, summaries, memory, image prompts) just wait, and on the LLM
+# they wait behind chat instead of in its queue.
+_interactive = contextvars.ContextVar("interactive", default=False)
+
+
+def set_interactive(interactive):
+    """Mark the current thread as serving an HTTP request (fail fast instead of waiting)."""
+    _interactive.set(interactive)
+
+
+def is_interactive():
+    return _interactive.get()
+
+
+class Overloaded(Exception):
+    """A backend is saturated. `status` is 429 (queue full) or 503 (waited too long)."""
+
+    def __init__(self, backend, retry_after, status=429):
+        super().__init__(f"The {backend} backend is busy, try again in {retry_after}s")
+        self.backend = backend
+        self.retry_after = retry_after
+        self.status = status
+
+
+class Limiter:
+    """Concurrency limit plus bounded wait queue for one backend.
+
+    With `background_concurrency` set, callers off the request path are a lower
+    class: they hold at most that many slots, only get a slot while no request
+    is waiting for one, and are not counted against `queue_size`.
+    """
+
+    def __init__(self, name, concurrency, queue_size, background_concurrency=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.background_concurrency = background_concurrency
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._active = 0
+        self._waiting = 0
+        self._background_active = 0
+        self._background_waiting = 0
+        self._rejected = 0
+        # Moving average of how long a slot is held, for Retry-After.
+        self._hold_seconds = 1.0
+
+    def retry_after(self):
+        with self._lock:
+            return max(1, math.ceil(self._hold_seconds * (self._waiting + 1) / self.concurrency))
+
+    def _reject(self, status):
+        with self._lock:
+            self._rejected += 1
+        error = Overloaded(self.name, self.retry_after(), status)
+        logger.info("Rejected request: %s", error)
+        return error
+
+    def _available(self, background):
+        if self._active >= self.concurrency:
+            return False
+        return not background or (self._waiting == 0 and self._background_active < self.background_concurrency)
+
+    def check(self):
+        """Raise Overloaded if a request arriving now would be turned away."""
+        with self._lock:
+            full = self._active >= self.concurrency and self._waiting >= self.queue_size
+        if full:
+            raise self._reject(429)
+
+    def acquire(self):
+        """Wait for a slot and return a ticket to pass to release()."""
+        interactive = _interactive.get()
+        background = self.background_concurrency is not None and not interactive
+        rejected = None
+        with self._freed:
+            if not self._available(background):
+                if background:
+                    self._background_waiting += 1
+                elif interactive and self._waiting >= self.queue_size:
+                    rejected = 429
+                else:
+                    self._waiting += 1
+                if rejected is None:
+                    try:
+                        if not self._freed.wait_for(lambda: self._available(background),
+                                                    timeout=config.QUEUE_TIMEOUT if interactive else None):
+                            rejected = 503
+                    finally:
+                        if background:
+                            self._background_waiting -= 1
+                        else:
+                            self._waiting -= 1
+                            # Background callers may have been waiting on this one.
+                            self._freed.notify_all()
+            if rejected is None:
+                self._active += 1
+                if background:
+                    self._background_active += 1
+        if rejected is not None:
+            raise self._reject(rejected)
+        return time.perf_counter(), background
+
+    def release(self, ticket):
+        acquired_at, background = ticket
+        held = time.perf_counter() - acquired_at
+        with self._freed:
+            self._active -= 1
+            if background:
+                self._background_active -= 1
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+            self._freed.notify_all()
+
+    @contextmanager
+    def slot(self):
+        ticket = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def status(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": self._waiting,
+                "background_active": self._background_active,
+                "background_waiting": self._background_waiting,
+                "concurrency": self.concurrency,
+                "queue_size": self.queue_size,
+                "rejected": self._rejected,
+            }
+
+
+if not 1 <= config.LLM_BACKGROUND_CONCURRENCY < config.LLM_CONCURRENCY:
+    raise ValueError(
+        f"LLM_BACKGROUND_CONCURRENCY must be between 1 and LLM_CONCURRENCY - 1 "
+        f"(got {config.LLM_BACKGROUND_CONCURRENCY} with LLM_CONCURRENCY={config.LLM_CONCURRENCY})"
+    )
+LLM = Limiter("llm", config.LLM_CONCURRENCY, config.LLM_QUEUE, config.LLM_BACKGROUND_CONCURRENCY)
+# Recordings transcribed piece by piece while they upload (audio_sessions) are
+# background work too; the request that finishes a recording goes ahead of them.
+TRANSCRIBER = Limiter("transcriber", config.TRANSCRIBE_CONCURRENCY, config.TRANSCRIBE_QUEUE,
+                      config.TRANSCRIBE_CONCURRENCY)
+IMAGE = Limiter("image", config.IMAGE_WORKERS, config.IMAGE_QUEUE)
+LIMITERS = [LLM, TRANSCRIBER, IMAGE]
+
+
+def status():
+    return {limiter.name: limiter.status() for limiter in LIMITERS}
@@ -0,0 +1,118 @@
+"""Micro-benchmark for chunk_with_references on synthetic reference-heavy papers.
+
+    python benchmarks/bench_citations.py [--references 500] [--chunks 400] [--papers 3]
+
+Times process_document on author-year papers with the indexed fuzzy matcher
+and with a linear scan over all references (the previous behaviour), and
+checks both link the same references.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunk_with_references  # noqa: E402
+
+SURNAMES = ["Khan", "Ahmed", "Ali", "Smith", "Brown", "Tanaka", "Garcia", "Okafor", "Muller", "Rossi"]
+
+
+def surname(i):
+    # Letters only, so citations match the author-year patterns.
+    suffix = ""
+    while True:
+        i, r = divmod(i, 26)
+        suffix += chr(ord("a") + r)
+        if i == 0:
+            return SURNAMES[len(suffix) % len(SURNAMES)] + suffix
+
+
+def synthetic_paper(n_references, n_chunks, rng):
+    references = []
+    cites = []
+    for i in range(n_references):
+        name = surname(i)
+        year = rng.randint(1990, 2024)
+        references.append(f"{name}, A., & Lee, B. ({year}). Flood risk study {i}. Journal of Hazards, {i % 40}.")
+        cites.append((name, year))
+
+    chunks = []
+    for _ in range(n_chunks):
+        words = []
+        for _ in range(6):
+            name, year = rng.choice(cites)
+            # "et al." citations never match a reference key directly, so
+            # they go through the fuzzy author-year matcher.
+            if rng.random() < 0.7:
+                words.append(f"({name} et al., {year})")
+            else:
+                words.append(f"({name}, {year})")
+            words.append("monsoon flooding impacts on vulnerable communities.")
+        chunks.append(" ".join(words))
+    return chunks, "References\n" + "\n".join(references)
+
+
+def linear_fuzzy(citation, all_references, index=None):
+    match = chunk_with_references.CITATION_AUTHOR_YEAR.search(citation)
+    if not match:
+        return None
+    cite_author, cite_year = match.group(1).lower(), match.group(2)
+    for ref_data in all_references.values():
+        if cite_year in str(ref_data.get('year', '')) and cite_author in ref_data.get('authors', '').lower():
+            return {
+                'citation_id': citation,
+                'title': ref_data['title'],
+                'authors': ref_data['authors'],
+                'year': ref_data['year'],
+                'raw_reference': ref_data['raw_text'],
+                'match_type': 'fuzzy'
+            }
+    return None
+
+
+def run(papers):
+    start = time.perf_counter()
+    results = [chunk_with_references.process_document(chunks, refs, "bench") for chunks, refs in papers]
+    return time.perf_counter() - start, results
+
+
+def linked(results):
+    return [
+        sorted(ref['raw_reference'] for ref in chunk['metadata']['cited_references'])
+        for result in results for chunk in result['processed_chunks']
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--references", type=int, default=500)
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--papers", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    papers = [synthetic_paper(args.references, args.chunks, rng) for _ in range(args.papers)]
+    total_chunks = args.chunks * args.papers
+
+    indexed_time, indexed = run(papers)
+
+    original = chunk_with_references.find_fuzzy_reference
+    chunk_with_references.find_fuzzy_reference = linear_fuzzy
+    try:
+        linear_time, linear = run(papers)
+    finally:
+        chunk_with_references.find_fuzzy_reference = original
+
+    assert linked(indexed) == linked(linear), "indexed and linear matchers disagree"
+
+    print(f"{args.papers} papers x {args.references} references x {args.chunks} chunks")
+    print(f"  indexed: {indexed_time * 1000:8.1f} ms  ({total_chunks / indexed_time:8.0f} chunks/sec)")
+    print(f"  linear:  {linear_time * 1000:8.1f} ms  ({total_chunks / linear_time:8.0f} chunks/sec)")
+    print(f"  speedup: {linear_time / indexed_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Speed and parity of the embedding backends (torch, int8, onnx).
+
+    python benchmarks/bench_embeddings.py [--backends torch int8 onnx] [--reference torch]
+                                          [--min-cosine 0.99] [--output out.json]
+
+Loads each backend from embeddings.BACKENDS and measures:
+
+- load time
+- single-query latency (batch of one, as a chat request sees it)
+- bulk throughput in texts/sec on chunk-sized passages (as ingestion sees it)
+- parity with the reference backend on a fixed corpus: per-text cosine
+  similarity (mean and min), and how many of each query's top-5 passages are
+  the same as the reference's
+
+Exits non-zero if a backend's minimum cosine is under --min-cosine, since its
+vectors would not be interchangeable with a collection built by the reference.
+Backends whose dependencies are missing are reported and skipped.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import embeddings  # noqa: E402
+
+# Fixed parity corpus, in the register of the documents the bot serves.
+SENTENCES = [
+    "Monsoon rains caused severe flooding across Sindh and southern Punjab.",
+    "Early warning systems reduced casualties during the 2022 floods.",
+    "The National Disaster Management Authority coordinates relief operations.",
+    "Glacial lake outburst floods threaten villages in Gilgit-Baltistan.",
+    "Heatwaves in Karachi are made worse by the urban heat island effect.",
+    "Community-based disaster risk management builds local resilience.",
+    "Drought in Tharparkar has led to food insecurity and child malnutrition.",
+    "Earthquake-resistant construction codes are poorly enforced in rural areas.",
+    "Cash transfer programmes helped displaced households recover faster.",
+    "Riverine erosion displaces farming communities along the Indus.",
+    "Climate finance for adaptation remains far below estimated needs.",
+    "Hospitals need backup power and water to keep working during disasters.",
+    "Satellite imagery was used to map inundated agricultural land.",
+    "Women and children are disproportionately affected by displacement.",
+    "Landslides blocked the Karakoram Highway after heavy rainfall.",
+    "Urban drainage systems in Lahore cannot handle extreme precipitation.",
+    "Insurance schemes for smallholder farmers remain limited in coverage.",
+    "School safety programmes train students in evacuation procedures.",
+    "Cyclone preparedness in coastal Balochistan depends on timely forecasts.",
+    "Post-disaster needs assessments estimate damages and recovery costs.",
+    "Deforestation increases the risk of flash floods in mountain valleys.",
+    "Contaminated water after floods spreads cholera and diarrhoeal disease.",
+    "Provincial authorities prepared contingency plans for the monsoon season.",
+    "Mangrove restoration protects the coastline from storm surges.",
+    "Locust swarms damaged crops across several districts in 2020.",
+    "Evacuation centres lacked adequate sanitation and privacy for women.",
+    "Seismic hazard maps guide land-use planning in Islamabad.",
+    "Remittances supported household consumption after the disaster.",
+    "Volunteers distributed tents, food packets and hygiene kits.",
+    "Rising temperatures accelerate glacier melt in the Himalaya.",
+    "The 2005 Kashmir earthquake killed more than 70,000 people.",
+    "Resilient infrastructure investments yield high benefit-cost ratios.",
+]
+QUERIES = [
+    "What caused the floods in Sindh?",
+    "How do early warning systems save lives?",
+    "Which communities are most vulnerable to displacement?",
+    "What are the health risks after floods?",
+    "How is climate change affecting glaciers?",
+    "What role does insurance play for farmers?",
+    "How can cities manage heavy rainfall?",
+    "What did the earthquake in Kashmir teach us?",
+]
+
+
+def passages(n, sentences_per_passage=6):
+    # Chunk-sized texts (~80-100 words) cycling through the fixed sentences.
+    out = []
+    for i in range(n):
+        out.append(" ".join(SENTENCES[(i + j * 7) % len(SENTENCES)] for j in range(sentences_per_passage)))
+    return out
+
+
+def encode(model, texts, batch_size):
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def measure(model, args):
+    encode(model, SENTENCES[:4], 4)  # warm-up
+
+    latencies = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        encode(model, [QUERIES[i % len(QUERIES)]], 1)
+        latencies.append(time.perf_counter() - start)
+
+    bulk = passages(args.texts)
+    start = time.perf_counter()
+    encode(model, bulk, args.batch_size)
+    bulk_seconds = time.perf_counter() - start
+
+    return {
+        "query_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "query_p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        "bulk_texts_per_sec": round(len(bulk) / bulk_seconds, 1),
+    }
+
+
+def corpus_vectors(model):
+    texts = SENTENCES + QUERIES + passages(64)
+    return encode(model, texts, 32)
+
+
+def top_k(vectors, k=5):
+    queries = vectors[len(SENTENCES):len(SENTENCES) + len(QUERIES)]
+    docs = vectors[len(SENTENCES) + len(QUERIES):]
+    return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+
+def parity(vectors, reference):
+    cosines = np.sum(vectors * reference, axis=1)
+    ours, theirs = top_k(vectors), top_k(reference)
+    overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(ours, theirs)]
+    return {
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "min_cosine": round(float(cosines.min()), 5),
+        "top5_agreement": round(float(np.mean(overlap)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(embeddings.BACKENDS))
+    parser.add_argument("--reference", default="torch", help="backend the others are compared with")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--queries", type=int, default=50, help="single-text encodes timed per backend")
+    parser.add_argument("--texts", type=int, default=512, help="passages encoded for the throughput test")
+    parser.add_argument("--batch-size", type=int, default=config.EMBED_BATCH_SIZE)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    backends = [args.reference] + [b for b in args.backends if b != args.reference]
+    results = {}
+    reference = None
+    for backend in backends:
+        start = time.perf_counter()
+        try:
+            model = embeddings.load_model(backend, args.model)
+        except ImportError as e:
+            print(f"{backend}: skipped ({e})")
+            results[backend] = {"error": str(e)}
+            continue
+        result = {"load_seconds": round(time.perf_counter() - start, 2)}
+        result.update(measure(model, args))
+
+        vectors = corpus_vectors(model)
+        if backend == args.reference:
+            reference = vectors
+        elif reference is not None:
+            result.update(parity(vectors, reference))
+        results[backend] = result
+        print(f"{backend}: {json.dumps(result)}")
+
+    failed = [
+        backend for backend, result in results.items()
+        if result.get("min_cosine", 1.0) < args.min_cosine
+    ]
+    report = {"model": args.model, "reference": args.reference, "results": results, "parity_failed": failed}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    if reference is None:
+        print(f"Reference backend {args.reference} unavailable; parity not checked")
+    if failed:
+        print(f"FAIL: below {args.min_cosine} cosine with {args.reference}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
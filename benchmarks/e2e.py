@@ -0,0 +1,357 @@
+"""Offline end-to-end benchmark for the chatbot routes.
+
+    python benchmarks/e2e.py [--docs 20] [--concurrency 1 4 8] [--requests 24] [--output out.json]
+    python benchmarks/e2e.py --compare benchmarks/results/before.json benchmarks/results/after.json
+
+Drives app.py through the Flask test client with no network or GPU:
+
+- the LLM is benchmarks/fake_ollama.py on a local port (OLLAMA_HOST), with a
+  configurable token and prefill rate
+- the embedding model is a deterministic hashing embedder registered in the
+  model registry (swap it with --embedder module:factory)
+- Whisper is replaced by a fixed transcript; /chat-audio still decodes the
+  clip with ffmpeg and is skipped when ffmpeg is missing
+
+Chroma and the conversation store run for real in a temporary directory. The
+report (ingestion chunks/sec, retrieval latency, /api/chat p50/p95/p99 per
+concurrency level, /chat-audio latency) is printed and written as JSON.
+"""
+import argparse
+import base64
+import hashlib
+import importlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_ollama import serve  # noqa: E402
+
+TOPICS = ["flood", "earthquake", "drought", "cyclone", "heatwave", "landslide", "glacial lake outburst"]
+REGIONS = ["Sindh", "Punjab", "Balochistan", "Khyber Pakhtunkhwa", "Gilgit-Baltistan", "Karachi"]
+MEASURES = ["early warning", "evacuation planning", "embankment maintenance", "cash transfers",
+            "shelter design", "community drills", "risk mapping", "insurance schemes"]
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words embedder with SentenceTransformer's `encode` signature."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.stack([self._embed(text) for text in sentences]) if sentences else np.zeros((0, self.dim))
+
+
+class FakeWhisper:
+    def transcribe(self, audio, **kwargs):
+        return {"text": " What are the main flood risks in Sindh?"}
+
+
+def load_factory(spec):
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "mean_ms": round(float(values.mean()), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def synthetic_documents(n_docs, words, rng):
+    docs = []
+    for i in range(n_docs):
+        sentences = []
+        while sum(len(s.split()) for s in sentences) < words:
+            sentences.append(
+                f"{rng.choice(MEASURES).capitalize()} reduced {rng.choice(TOPICS)} losses in "
+                f"{rng.choice(REGIONS)} by {rng.randint(5, 60)} percent ({rng.choice(['Khan', 'Ahmed', 'Smith'])}, "
+                f"{rng.randint(2000, 2024)})."
+            )
+            if rng.random() < 0.15:
+                sentences.append("\n\n")
+        docs.append((f"report_{i}.txt", " ".join(sentences).encode("utf-8")))
+    return docs
+
+
+def synthetic_queries(n, rng):
+    return [f"How does {rng.choice(MEASURES)} reduce {rng.choice(TOPICS)} risk in {rng.choice(REGIONS)}?"
+            for _ in range(n)]
+
+
+def bench_ingestion(app, docs, mode, timeout):
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.post("/upload", data={
+        "mode": mode,
+        "files": [(io.BytesIO(data), name) for name, data in docs]
+    }, content_type="multipart/form-data")
+    job_id = response.get_json()["job_id"]
+
+    while True:
+        job = client.get(f"/api/upload/{job_id}").get_json()
+        if job["status"] in ("done", "failed") or time.perf_counter() - start > timeout:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    files = job["files"]
+    chunks = sum(entry.get("chunks", 0) for entry in files)
+    store_seconds = sum(entry.get("seconds", 0) for entry in files)
+    return {
+        "status": job["status"],
+        "files": len(files),
+        "failed": sum(entry["stage"] == "failed" for entry in files),
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(chunks / elapsed, 1) if elapsed else 0.0,
+        "store_chunks_per_sec": round(chunks / store_seconds, 1) if store_seconds else 0.0,
+    }
+
+
+def bench_retrieval(queries, mode):
+    from allclassesgood import Chroma
+
+    chroma = Chroma(mode=mode)
+    embed, search = [], []
+    for query in queries:
+        start = time.perf_counter()
+        embedding = chroma.embed_query(query)
+        embed.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        chroma.search_documents(query, embedding)
+        search.append(time.perf_counter() - start)
+    return {"embed": percentiles(embed), "search": percentiles(search)}
+
+
+def bench_chat(app, queries, concurrency, n_requests, mode):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    pending = list(range(n_requests))
+
+    def worker():
+        client = app.test_client()
+        conversation_id = client.post("/api/new_chat", json={"mode": mode}).get_json()["conversation_id"]
+        while True:
+            with lock:
+                if not pending:
+                    return
+                i = pending.pop()
+            start = time.perf_counter()
+            response = client.post("/api/chat", json={
+                "message": queries[i % len(queries)],
+                "conversation_id": conversation_id,
+                "mode": mode
+            })
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(response.status_code)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        **percentiles(latencies),
+        "errors": len(errors),
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def synthetic_wav(seconds=2.0, sample_rate=16000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16)
+    silence = np.zeros(sample_rate // 2, dtype=np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(np.concatenate([silence, tone, silence]).tobytes())
+    return buf.getvalue()
+
+
+def bench_audio(app, n_requests, mode):
+    if shutil.which("ffmpeg") is None:
+        return {"skipped": "ffmpeg not found"}
+    client = app.test_client()
+    conversation_id = client.post("/api/new_chat", json={"mode": mode}).get_json()["conversation_id"]
+    audio = base64.b64encode(synthetic_wav()).decode()
+    latencies, errors = [], 0
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        response = client.post("/chat-audio", json={"audio": audio, "conversation_id": conversation_id, "mode": mode})
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    return {**percentiles(latencies), "errors": errors}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def row(label, old, new, higher_is_better=False):
+        if old is None or new is None:
+            return
+        change = (new - old) / old * 100 if old else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {label:<32} {old:>10.2f} -> {new:>10.2f}  ({change:+.1f}%{' better' if better and change else ''})")
+
+    print(f"{before_path} ({before.get('commit')}) -> {after_path} ({after.get('commit')})")
+    row("ingestion chunks/sec", before["ingestion"].get("chunks_per_sec"),
+        after["ingestion"].get("chunks_per_sec"), higher_is_better=True)
+    for stage in ("embed", "search"):
+        for key in ("p50_ms", "p95_ms"):
+            row(f"retrieval {stage} {key}", before["retrieval"][stage].get(key), after["retrieval"][stage].get(key))
+    for level in sorted(set(before["chat"]) & set(after["chat"]), key=int):
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            row(f"chat c={level} {key}", before["chat"][level].get(key), after["chat"][level].get(key))
+        row(f"chat c={level} requests/sec", before["chat"][level].get("requests_per_sec"),
+            after["chat"][level].get("requests_per_sec"), higher_is_better=True)
+    row("audio p50_ms", before["audio"].get("p50_ms"), after["audio"].get("p50_ms"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--words", type=int, default=3000, help="words per synthetic document")
+    parser.add_argument("--queries", type=int, default=50, help="retrieval queries")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=24, help="/api/chat requests per concurrency level")
+    parser.add_argument("--audio-requests", type=int, default=5)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="fake LLM tokens/sec")
+    parser.add_argument("--prefill-rate", type=float, default=4000.0, help="fake LLM prompt tokens/sec")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--embedder", default=None,
+                        help="module:factory returning an object with encode(); defaults to a hashing embedder")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--mode", default="pakistan")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    path = os.path.abspath(args.output) if args.output else os.path.join(
+        ROOT, "benchmarks", "results", f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="e2e-bench-")
+    server, fake, url = serve(token_rate=args.token_rate, prefill_rate=args.prefill_rate,
+                              answer_tokens=args.answer_tokens)
+
+    # config reads the environment at import, so this has to happen first.
+    os.environ.update({
+        "OLLAMA_HOST": url,
+        "OLLAMA_RETRIES": "0",
+        "CHROMA_PATH": os.path.join(workdir, "chroma"),
+        "CONVERSATION_DB": os.path.join(workdir, "conversations.db"),
+        "WARM_UP_ON_START": "0",
+        "ANSWER_CACHE_ENABLED": "1" if args.answer_cache else "0",
+        "LOG_LEVEL": "DEBUG" if args.verbose else "WARNING",
+    })
+    os.chdir(workdir)  # the app writes uploads/ and the policy brief into the working directory
+
+    import config
+    import metrics
+    import registry
+
+    embedder = load_factory(args.embedder)() if args.embedder else HashEmbedder()
+    registry.register_model("embedding_model", embedder)
+    registry.register_model(f"whisper_{config.WHISPER_MODEL}", FakeWhisper())
+
+    import app as app_module
+    app = app_module.app
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "verbose")},
+    }
+    try:
+        docs = synthetic_documents(args.docs, args.words, rng)
+        queries = synthetic_queries(args.queries, rng)
+        report["ingestion"] = bench_ingestion(app, docs, args.mode, args.timeout)
+        report["retrieval"] = bench_retrieval(queries, args.mode)
+        report["chat"] = {
+            str(level): bench_chat(app, queries, level, args.requests, args.mode)
+            for level in args.concurrency
+        }
+        report["audio"] = bench_audio(app, args.audio_requests, args.mode)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    report["llm"] = {"requests": fake.requests, "prompt_tokens": fake.prompt_tokens}
+    # Where the time went, from the app's own stage histograms.
+    report["stages"] = {
+        stage: {"count": count, "mean_ms": round(total / count * 1000, 2)}
+        for (stage,), (count, total) in sorted(metrics.STAGE_SECONDS.totals().items()) if count
+    }
+
+    print(json.dumps(report, indent=2))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
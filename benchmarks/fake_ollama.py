@@ -0,0 +1,158 @@
+"""Local stand-in for the Ollama HTTP API, for benchmarks and offline runs.
+
+    python benchmarks/fake_ollama.py [--port 11435] [--token-rate 40] [--prefill-rate 800]
+
+Answers /api/chat and /api/generate (streamed NDJSON or a single JSON body)
+with canned text. It sleeps to mimic prompt prefill (prompt tokens divided by
+--prefill-rate) and generation (--answer-tokens at --token-rate per second).
+Point the app at it with OLLAMA_HOST=http://127.0.0.1:<port>.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("Flood early warning systems reduce losses when forecasts reach communities in time [1]. "
+         "Evidence from Sindh shows that embankment maintenance and evacuation drills matter [2]. ").split()
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class FakeOllama:
+    def __init__(self, token_rate=40.0, prefill_rate=800.0, answer_tokens=120):
+        self.token_rate = token_rate
+        self.prefill_rate = prefill_rate
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self.prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def tokens(self):
+        for i in range(self.answer_tokens):
+            yield WORDS[i % len(WORDS)] + " "
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": "llama3.1:latest", "model": "llama3.1:latest"}]})
+                elif self.path in ("/", "/api/version"):
+                    self._send_json({"version": "0.0.0-fake"})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path not in ("/api/chat", "/api/generate"):
+                    self._send_json({"error": "not found"}, 404)
+                    return
+
+                chat = self.path == "/api/chat"
+                prompt = (
+                    "".join(m.get("content", "") for m in request.get("messages", []))
+                    if chat else request.get("prompt", "")
+                )
+                prompt_tokens = estimate_tokens(prompt) if prompt else 0
+                with fake._lock:
+                    fake.requests += 1
+                    fake.prompt_tokens += prompt_tokens
+                # An empty prompt is a keep-alive/preload request.
+                if not prompt:
+                    self._send_json(fake.message(chat, "", True, request, 0, 0))
+                    return
+
+                time.sleep(prompt_tokens / fake.prefill_rate)
+                if not request.get("stream", True):
+                    time.sleep(fake.answer_tokens / fake.token_rate)
+                    text = "".join(fake.tokens())
+                    self._send_json(fake.message(chat, text, True, request, prompt_tokens, fake.answer_tokens))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in fake.tokens():
+                    time.sleep(1 / fake.token_rate)
+                    self._chunk(fake.message(chat, token, False, request, 0, 0))
+                self._chunk(fake.message(chat, "", True, request, prompt_tokens, fake.answer_tokens))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, payload):
+                line = json.dumps(payload).encode() + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def message(self, chat, text, done, request, prompt_tokens, eval_count):
+        payload = {
+            "model": request.get("model", "llama3.1"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "done": done,
+        }
+        if chat:
+            payload["message"] = {"role": "assistant", "content": text}
+        else:
+            payload["response"] = text
+        if done:
+            payload.update({
+                "done_reason": "stop",
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": eval_count,
+                "total_duration": 0,
+                "load_duration": 0,
+                "prompt_eval_duration": 0,
+                "eval_duration": 0,
+            })
+        return payload
+
+
+def serve(host="127.0.0.1", port=0, **options):
+    """Start the fake server on a background thread; returns (server, fake, base_url)."""
+    fake = FakeOllama(**options)
+    server = ThreadingHTTPServer((host, port), fake.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=40.0)
+    parser.add_argument("--prefill-rate", type=float, default=800.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    server, _, url = serve(args.host, args.port, token_rate=args.token_rate,
+                           prefill_rate=args.prefill_rate, answer_tokens=args.answer_tokens)
+    print(f"Fake Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Import-time budget check for the web app.
+
+    python benchmarks/import_budget.py [--budget 1.5] [--runs 3]
+
+Imports `app` in fresh interpreters (with warm-up disabled) and fails with a
+non-zero exit status if the best wall time is over --budget seconds, or if any
+heavy dependency was imported eagerly. Those belong behind the feature that
+needs them, so workers start fast and only pay for what they use.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must only be imported on first use of their feature.
+HEAVY_MODULES = [
+    "torch", "diffusers", "whisper", "chromadb", "sentence_transformers",
+    "langchain", "langchain_core", "langchain_ollama", "ollama", "httpx",
+    "pandas", "PyPDF2", "docx",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure(workdir):
+    env = dict(os.environ, WARM_UP_ON_START="0", CONVERSATION_DB=os.path.join(workdir, "conversations.db"),
+               PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(f"FAIL: `import app` raised (exit status {result.returncode})")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=1.5, help="seconds allowed for `import app`")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [measure(workdir) for _ in range(args.runs)]
+
+    best = min(result["seconds"] for result in results)
+    eager = sorted({
+        name.split(".")[0] for result in results for name in result["modules"]
+        if name.split(".")[0] in HEAVY_MODULES
+    })
+
+    print(f"import app: best {best:.3f}s of {args.runs} (budget {args.budget:.3f}s)")
+    failed = False
+    if best > args.budget:
+        print(f"FAIL: import took {best:.3f}s, over the {args.budget:.3f}s budget")
+        failed = True
+    if eager:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(eager)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
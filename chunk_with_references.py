@@ -1,20 +1,57 @@
+import logging
 import re
 from typing import List, Dict, Any, Tuple, Optional
-from uuid import uuid4
+import hashlib
+
+logger = logging.getLogger(__name__)
+
+def content_hash(text: str) -> str:
+    """Stable identifier derived from the text itself."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# Patterns are compiled once at import instead of on every call.
+STYLE_PATTERNS = {
+    'numbered_bracket': re.compile(r'\[\d+\]'),
+    'numbered_paren': re.compile(r'\(\d+\)'),
+    'numbered_dot': re.compile(r'\b\d+\.\s'),  # "1. ", "2. "
+    'superscript': re.compile(r'\^\d+'),
+    'author_year': re.compile(r'\([A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}\)'),
+    'author_year_bracket': re.compile(r'\[[A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}\]'),
+    'plain_author': re.compile(r'\b[A-Z][a-z]+\s+et\s+al\.?\s+\(\d{4}\)')
+}
+
+CITATION_PATTERNS = {
+    'numbered_bracket': re.compile(r'\[(\d+(?:[,\s\-]*\d+)*)\]'),      # [1], [1,2], [1-3]
+    'numbered_paren': re.compile(r'\((\d+(?:[,\s\-]*\d+)*)\)'),        # (1), (1,2)
+    'numbered_dot': re.compile(r'(?<!\w)(\d+)(?=\.\s)'),               # "1. " but not "Fig. 1."
+    'superscript': re.compile(r'\^(\d+(?:[,\s]*\d+)*)'),               # ^1, ^1,2
+    'author_year': re.compile(r'\(([A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}[a-z]?)\)'),  # (Smith, 2023)
+    'author_year_bracket': re.compile(r'\[([A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}[a-z]?)\]'),  # [Smith, 2023]
+    'plain_author': re.compile(r'\b([A-Z][a-z]+(?:\s+et\s+al\.?)?)\s+\((\d{4})\)'),  # Smith et al. (2023)
+    'none': None
+}
+
+IEEE_REFERENCE = re.compile(r'\[\d+\]\s*[A-Z]')
+NUMBERED_REFERENCE = re.compile(r'^\d+\.\s*[A-Z]', re.MULTILINE)
+APA_REFERENCE = re.compile(r'[A-Za-z]+\s*\(\d{4}\)')
+PLAIN_REFERENCE = re.compile(r'^[A-Z][a-z]+,?\s+[A-Z]', re.MULTILINE)
+IEEE_ENTRY = re.compile(r'\[(\d+)\]\s*(.+?)(?=\[\d+\]|\Z)', re.DOTALL)
+NUMBERED_ENTRY = re.compile(r'^(\d+)\.\s*(.+?)(?=^\d+\.\s|\Z)', re.MULTILINE | re.DOTALL)
+APA_SPLIT = re.compile(r'\n(?=[A-Z][a-z]+,?\s)')
+PLAIN_SPLIT = re.compile(r'\n(?=[A-Z][a-z]+[,\s])|(?:\n\s*\n)')
+QUOTED_TITLE = re.compile(r'"([^"]+)"')
+YEAR = re.compile(r'\b(19|20)\d{2}\b')
+AUTHOR_SEPARATOR = re.compile(r'[,.]')
+LEADING_NON_WORD = re.compile(r'^[^\w]*')
+DIGITS = re.compile(r'\d+')
+CITATION_AUTHOR_YEAR = re.compile(r'([A-Za-z]+).*?(\d{4})')
+WORD = re.compile(r'[a-z]+')
 
 def detect_citation_style(text: str) -> str:
     """Automatically detect the citation style used in the text."""
     
     # Count different citation patterns
-    patterns = {
-        'numbered_bracket': len(re.findall(r'\[\d+\]', text)),
-        'numbered_paren': len(re.findall(r'\(\d+\)', text)),
-        'numbered_dot': len(re.findall(r'\b\d+\.\s', text)),  # "1. ", "2. "
-        'superscript': len(re.findall(r'\^\d+', text)),
-        'author_year': len(re.findall(r'\([A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}\)', text)),
-        'author_year_bracket': len(re.findall(r'\[[A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}\]', text)),
-        'plain_author': len(re.findall(r'\b[A-Z][a-z]+\s+et\s+al\.?\s+\(\d{4}\)', text))
-    }
+    patterns = {style: len(pattern.findall(text)) for style, pattern in STYLE_PATTERNS.items()}
     
     # Return the style with highest count
     if max(patterns.values()) == 0:
@@ -26,13 +63,13 @@ def detect_reference_format(references_text: str) -> str:
     """Automatically detect reference format in the reference section."""
     
     # Check for different reference formats
-    if re.search(r'\[\d+\]\s*[A-Z]', references_text):
+    if IEEE_REFERENCE.search(references_text):
         return 'ieee'
-    elif re.search(r'^\d+\.\s*[A-Z]', references_text, re.MULTILINE):
+    elif NUMBERED_REFERENCE.search(references_text):
         return 'numbered'
-    elif re.search(r'[A-Za-z]+\s*\(\d{4}\)', references_text):
+    elif APA_REFERENCE.search(references_text):
         return 'apa'
-    elif re.search(r'^[A-Z][a-z]+,?\s+[A-Z]', references_text, re.MULTILINE):
+    elif PLAIN_REFERENCE.search(references_text):
         return 'plain_text'  # Author, Title format without numbers
     else:
         return 'plain_text'  # default fallback for unnumbered references
@@ -47,8 +84,7 @@ def parse_references_from_text(references_text: str, format_type: str = None) ->
     
     if format_type == 'ieee':
         # Pattern for IEEE format: [1] Authors, "Title", Journal, Year
-        pattern = r'\[(\d+)\]\s*(.+?)(?=\[\d+\]|\Z)'
-        matches = re.findall(pattern, references_text, re.DOTALL)
+        matches = IEEE_ENTRY.findall(references_text)
         
         for ref_num, ref_text in matches:
             ref_text = ref_text.strip().replace('\n', ' ')
@@ -56,8 +92,7 @@ def parse_references_from_text(references_text: str, format_type: str = None) ->
     
     elif format_type == 'numbered':
         # Pattern for numbered format: 1. Reference text
-        pattern = r'^(\d+)\.\s*(.+?)(?=^\d+\.\s|\Z)'
-        matches = re.findall(pattern, references_text, re.MULTILINE | re.DOTALL)
+        matches = NUMBERED_ENTRY.findall(references_text)
         
         for ref_num, ref_text in matches:
             ref_text = ref_text.strip().replace('\n', ' ')
@@ -68,7 +103,7 @@ def parse_references_from_text(references_text: str, format_type: str = None) ->
         lines = references_text.strip().split('\n\n')
         if len(lines) == 1:
             # If no double newlines, try to split by author patterns
-            lines = re.split(r'\n(?=[A-Z][a-z]+,?\s)', references_text)
+            lines = APA_SPLIT.split(references_text)
         
         ref_count = 1
         for line in lines:
@@ -88,7 +123,7 @@ def parse_references_from_text(references_text: str, format_type: str = None) ->
         lines = references_text.strip().split('\n\n')
         if len(lines) == 1:
             # Try splitting by author patterns or double spaces
-            lines = re.split(r'\n(?=[A-Z][a-z]+[,\s])|(?:\n\s*\n)', references_text)
+            lines = PLAIN_SPLIT.split(references_text)
         
         ref_count = 1
         for line in lines:
@@ -114,11 +149,11 @@ def parse_single_reference(ref_text: str) -> Dict[str, str]:
     """Parse a single reference text into components."""
     
     # Extract title (usually in quotes)
-    title_match = re.search(r'"([^"]+)"', ref_text)
+    title_match = QUOTED_TITLE.search(ref_text)
     title = title_match.group(1) if title_match else ""
     
     # Extract year
-    year_match = re.search(r'\b(19|20)\d{2}\b', ref_text)
+    year_match = YEAR.search(ref_text)
     year = year_match.group() if year_match else ""
     
     # Extract authors (heuristic approach)
@@ -127,11 +162,11 @@ def parse_single_reference(ref_text: str) -> Dict[str, str]:
         author_text = ref_text.split('"')[0].strip().rstrip(',')
     else:
         # Take first part before comma or period
-        parts = re.split(r'[,.]', ref_text)
+        parts = AUTHOR_SEPARATOR.split(ref_text)
         author_text = parts[0] if parts else ref_text
     
     # Clean up authors
-    author_text = re.sub(r'^[^\w]*', '', author_text)  # Remove leading non-word chars
+    author_text = LEADING_NON_WORD.sub('', author_text)  # Remove leading non-word chars
     
     return {
         'title': title,
@@ -146,31 +181,17 @@ def extract_citations_from_chunk(chunk_text: str, citation_style: str = None) ->
     if citation_style is None:
         citation_style = detect_citation_style(chunk_text)
     
-    citation_patterns = {
-        'numbered_bracket': r'\[(\d+(?:[,\s\-]*\d+)*)\]',      # [1], [1,2], [1-3]
-        'numbered_paren': r'\((\d+(?:[,\s\-]*\d+)*)\)',        # (1), (1,2)
-        'numbered_dot': r'(?<!\w)(\d+)(?=\.\s)',               # "1. " but not "Fig. 1."
-        'superscript': r'\^(\d+(?:[,\s]*\d+)*)',               # ^1, ^1,2
-        'author_year': r'\(([A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}[a-z]?)\)',  # (Smith, 2023)
-        'author_year_bracket': r'\[([A-Za-z]+(?:\s+et\s+al\.?)?\s*,?\s*\d{4}[a-z]?)\]',  # [Smith, 2023]
-        'plain_author': r'\b([A-Z][a-z]+(?:\s+et\s+al\.?)?)\s+\((\d{4})\)',  # Smith et al. (2023)
-        'none': []
-    }
-    
-    if citation_style not in citation_patterns:
+    pattern = CITATION_PATTERNS.get(citation_style)
+    if pattern is None:
         return []
     
-    pattern = citation_patterns[citation_style]
-    if not pattern:
-        return []
-    
-    matches = re.findall(pattern, chunk_text)
+    matches = pattern.findall(chunk_text)
     
     citations = []
     for match in matches:
         if citation_style in ['numbered_bracket', 'numbered_paren', 'superscript']:
             # Handle various separators: "1,2,3", "1-3", "1 2 3"
-            numbers = re.findall(r'\d+', match)
+            numbers = DIGITS.findall(match)
             citations.extend(numbers)
         elif citation_style == 'numbered_dot':
             citations.append(match)
@@ -185,8 +206,60 @@ def extract_citations_from_chunk(chunk_text: str, citation_style: str = None) ->
     
     return list(set(citations))  # Remove duplicates
 
+class ReferenceIndex:
+    """Author-year index over parsed references for fuzzy citation matching.
+
+    Gives the same answer as scanning every reference in order for one whose
+    year contains the citation year and whose authors contain the cited
+    surname, but only looks at references from that year.
+    """
+    
+    def __init__(self, all_references: Dict[str, Dict]):
+        self.by_year = {}       # year -> [(position, ref_key, authors_lower)]
+        self.by_surname = {}    # (surname, year) -> index of first entry in by_year[year]
+        self.irregular = []     # references whose year is not a plain 4-digit year
+        self._memo = {}
+        
+        for position, (ref_key, ref_data) in enumerate(all_references.items()):
+            year = str(ref_data.get('year', ''))
+            authors = ref_data.get('authors', '').lower()
+            if len(year) == 4:
+                bucket = self.by_year.setdefault(year, [])
+                for surname in WORD.findall(authors):
+                    self.by_surname.setdefault((surname, year), len(bucket))
+                bucket.append((position, ref_key, authors))
+            elif year:
+                self.irregular.append((position, ref_key, authors, year))
+    
+    def lookup(self, cite_author: str, cite_year: str) -> Optional[str]:
+        """Key of the first reference matching (lowercase author, year), or None."""
+        key = (cite_author, cite_year)
+        if key in self._memo:
+            return self._memo[key]
+        
+        best = None
+        bucket = self.by_year.get(cite_year, [])
+        # A whole-word surname hit bounds the search; earlier entries can
+        # still match as substrings ("smith" in "smithson").
+        first_exact = self.by_surname.get(key)
+        candidates = bucket if first_exact is None else bucket[:first_exact + 1]
+        for position, ref_key, authors in candidates:
+            if cite_author in authors:
+                best = (position, ref_key)
+                break
+        
+        for position, ref_key, authors, year in self.irregular:
+            if best is not None and position > best[0]:
+                break
+            if cite_year in year and cite_author in authors:
+                best = (position, ref_key)
+                break
+        
+        self._memo[key] = best[1] if best else None
+        return self._memo[key]
+
 def get_chunk_references(chunk_text: str, all_references: Dict[str, Dict], 
-                        citation_style: str = None) -> List[Dict]:
+                        citation_style: str = None, index: ReferenceIndex = None) -> List[Dict]:
     """Get only the references that are cited in this specific chunk."""
     
     # Extract citations from the chunk
@@ -206,17 +279,18 @@ def get_chunk_references(chunk_text: str, all_references: Dict[str, Dict],
             })
         else:
             # Try fuzzy matching for author-year citations
-            fuzzy_match = find_fuzzy_reference(citation, all_references)
+            fuzzy_match = find_fuzzy_reference(citation, all_references, index)
             if fuzzy_match:
                 chunk_references.append(fuzzy_match)
     
     return chunk_references
 
-def find_fuzzy_reference(citation: str, all_references: Dict[str, Dict]) -> Optional[Dict]:
+def find_fuzzy_reference(citation: str, all_references: Dict[str, Dict],
+                         index: ReferenceIndex = None) -> Optional[Dict]:
     """Find reference through fuzzy matching for author-year citations."""
     
     # Extract author and year from citation
-    author_year_match = re.search(r'([A-Za-z]+).*?(\d{4})', citation)
+    author_year_match = CITATION_AUTHOR_YEAR.search(citation)
     if not author_year_match:
         return None
     
@@ -224,22 +298,21 @@ def find_fuzzy_reference(citation: str, all_references: Dict[str, Dict]) -> Opti
     cite_year = author_year_match.group(2)
     
     # Search references for matching author and year
-    for ref_key, ref_data in all_references.items():
-        # Check if year matches
-        if cite_year in str(ref_data.get('year', '')):
-            # Check if author matches
-            ref_authors = ref_data.get('authors', '').lower()
-            if cite_author in ref_authors:
-                return {
-                    'citation_id': citation,
-                    'title': ref_data['title'],
-                    'authors': ref_data['authors'],
-                    'year': ref_data['year'],
-                    'raw_reference': ref_data['raw_text'],
-                    'match_type': 'fuzzy'
-                }
-    
-    return None
+    if index is None:
+        index = ReferenceIndex(all_references)
+    ref_key = index.lookup(cite_author, cite_year)
+    if ref_key is None:
+        return None
+    
+    ref_data = all_references[ref_key]
+    return {
+        'citation_id': citation,
+        'title': ref_data['title'],
+        'authors': ref_data['authors'],
+        'year': ref_data['year'],
+        'raw_reference': ref_data['raw_text'],
+        'match_type': 'fuzzy'
+    }
 
 def process_document(chunks: List[str], references_text: str, 
                     document_id: str = None) -> Dict[str, Any]:
@@ -251,14 +324,16 @@ def process_document(chunks: List[str], references_text: str,
     
     # Parse references
     all_references = parse_references_from_text(references_text, reference_format)
+    index = ReferenceIndex(all_references)
     
     processed_chunks = []
     
     for i, chunk_text in enumerate(chunks):
-        chunk_id = f"{document_id}_chunk_{i+1}" if document_id else f"chunk_{i+1}"
+        # Content-addressed, so re-uploads map onto the chunks already stored
+        chunk_id = content_hash(chunk_text)
         
         # Get references for this chunk
-        chunk_references = get_chunk_references(chunk_text, all_references, citation_style)
+        chunk_references = get_chunk_references(chunk_text, all_references, citation_style, index)
         
         # Prepare metadata
         metadata = {
@@ -295,45 +370,41 @@ def process_multiple_documents(documents: List[Dict[str, Any]]) -> List[Dict]:
         chunks = doc['chunks']
         references_text = doc['references']
         
-        print(f"Processing document: {doc_id}")
+        logger.debug("Processing document: %s", doc_id)
         
         # Process this document
         result = process_document(chunks, references_text, doc_id)
-        print("Result done")
-        
-        print(f"  - Citation style: {result['citation_style']}")
-        print(f"  - Reference format: {result['reference_format']}")
-        print(f"  - Total references: {result['total_references']}")
-        print(f"  - Chunks with citations: {result['chunks_with_citations']}/{len(chunks)}")
+        logger.debug(
+            "Document %s: citation style %s, reference format %s, %d references, %d/%d chunks with citations",
+            doc_id, result['citation_style'], result['reference_format'],
+            result['total_references'], result['chunks_with_citations'], len(chunks)
+        )
         
         all_processed_chunks.extend(result['processed_chunks'])
     return all_processed_chunks
 
 # Example usage
 def get_references(doc_chunks, references):
-    uuids = [str(uuid4()) for _ in range(len(doc_chunks))]
+    doc_ids = [content_hash('\n'.join(chunks)) for chunks in doc_chunks]
     documents = [
     {
         'id': id_,
         'chunks': chunks,
         'references': refs
     }
-    for id_, chunks, refs in zip(uuids, doc_chunks, references)]
+    for id_, chunks, refs in zip(doc_ids, doc_chunks, references)]
     
     # Process all documents
     all_chunks = process_multiple_documents(documents)
     
-    print(f"\n=== FINAL RESULTS ===")
-    print(f"Total processed chunks: {len(all_chunks)}")
+    logger.debug("Total processed chunks: %d", len(all_chunks))
     
     # Show some examples
-    for chunk in all_chunks[:3]:  # Show first 3
-        print(f"\n--- {chunk['id']} ---")
-        print(f"Text: {chunk['text'][:60]}...")
-        print(f"Style: {chunk['metadata']['citation_style']}")
-        print(f"Citations: {chunk['metadata']['citation_count']}")
-        if chunk['metadata']['cited_references']:
+    if logger.isEnabledFor(logging.DEBUG):
+        for chunk in all_chunks[:3]:  # Show first 3
+            logger.debug("%s: %s... style=%s citations=%d", chunk['id'], chunk['text'][:60],
+                         chunk['metadata']['citation_style'], chunk['metadata']['citation_count'])
             for ref in chunk['metadata']['cited_references']:
-                print(f"  [{ref['citation_id']}] {ref['title'] or ref['authors']}")
+                logger.debug("  [%s] %s", ref['citation_id'], ref['title'] or ref['authors'])
     
     return all_chunks
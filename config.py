@@ -0,0 +1,166 @@
+import os
+
+# ==========================================================
+# LLM (OLLAMA)
+# ==========================================================
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://172.18.1.152:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.1")
+LLM_TEMPERATURE = float(os.environ.get("LLM_TEMPERATURE", "0.3"))
+# Seconds per HTTP call to Ollama, and retries (with exponential backoff) on
+# connection errors, timeouts and server errors.
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "120"))
+OLLAMA_RETRIES = int(os.environ.get("OLLAMA_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "1.0"))
+# How long Ollama keeps the model loaded after the last request.
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Concurrent generations allowed against the Ollama host from this process.
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "2"))
+# Of those, the most that background work (conversation summaries, document
+# summaries, image prompts) may hold. It only gets a slot when no chat request
+# is waiting, and does not count against LLM_QUEUE. It must be between 1 and
+# LLM_CONCURRENCY - 1 so chat always has a slot of its own; LLM_CONCURRENCY=1
+# is refused at startup.
+LLM_BACKGROUND_CONCURRENCY = int(os.environ.get("LLM_BACKGROUND_CONCURRENCY", str(max(1, LLM_CONCURRENCY - 1))))
+
+# ==========================================================
+# FEATURES
+# ==========================================================
+# Disabled features are never imported, so workers without a GPU or audio
+# needs skip torch/diffusers and Whisper entirely.
+ENABLE_IMAGE_GENERATION = os.environ.get("ENABLE_IMAGE_GENERATION", "1") == "1"
+ENABLE_SPEECH = os.environ.get("ENABLE_SPEECH", "1") == "1"
+
+# ==========================================================
+# BACKPRESSURE
+# ==========================================================
+# Each backend runs at most its concurrency limit (LLM_CONCURRENCY,
+# EMBED_CONCURRENCY, TRANSCRIBE_CONCURRENCY, IMAGE_WORKERS) at once and lets
+# up to *_QUEUE more requests wait. Further requests get 429 with Retry-After;
+# requests that waited QUEUE_TIMEOUT seconds without a slot get 503.
+LLM_QUEUE = int(os.environ.get("LLM_QUEUE", "8"))
+# Embedding calls run as shared batches; EMBED_QUEUE counts queued queries.
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "2"))
+EMBED_QUEUE = int(os.environ.get("EMBED_QUEUE", "64"))
+TRANSCRIBE_CONCURRENCY = int(os.environ.get("TRANSCRIBE_CONCURRENCY", "1"))
+TRANSCRIBE_QUEUE = int(os.environ.get("TRANSCRIBE_QUEUE", "4"))
+IMAGE_QUEUE = int(os.environ.get("IMAGE_QUEUE", "4"))
+QUEUE_TIMEOUT = float(os.environ.get("QUEUE_TIMEOUT", "30"))
+
+# ==========================================================
+# LOGGING / METRICS
+# ==========================================================
+# DEBUG also logs every timed stage; stage histograms are served on /metrics.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+
+# ==========================================================
+# VECTOR STORE / EMBEDDINGS
+# ==========================================================
+CHROMA_PATH = os.environ.get("CHROMA_PATH", "./chroma_local_db")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# torch (reference), int8 (dynamically quantized torch) or onnx (ONNX Runtime,
+# needs sentence-transformers[onnx]). Run benchmarks/bench_embeddings.py to
+# check speed and parity before switching a node with existing collections.
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# ONNX file inside the model repo, e.g. onnx/model_qint8_avx2.onnx for int8 ONNX.
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "")
+# Chunks written to Chroma per bulk upsert, and texts per model forward pass.
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "256"))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# How long the embedding service waits for concurrent texts to join a batch.
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))
+# Processes used to parse uploads; large PDFs are split into page ranges.
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(os.cpu_count() or 2)))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "50"))
+# Background ingestion threads; further uploads wait in the queue.
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+# Chunk embeddings kept in memory, keyed by chunk content hash.
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "50000"))
+
+# Load the embedding model and DB client when the app starts instead of on
+# the first request.
+WARM_UP_ON_START = os.environ.get("WARM_UP_ON_START", "1") == "1"
+
+# ==========================================================
+# CONVERSATIONS
+# ==========================================================
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "sqlite")
+CONVERSATION_DB = os.environ.get("CONVERSATION_DB", "./conversations.db")
+
+# Prompt history is a rolling summary of older turns plus the turns it does
+# not cover yet (normally just the last exchange).
+MEMORY_SUMMARY_WORDS = int(os.environ.get("MEMORY_SUMMARY_WORDS", "150"))
+# Each verbatim turn is cut to this many words.
+MEMORY_LAST_TURN_WORDS = int(os.environ.get("MEMORY_LAST_TURN_WORDS", "300"))
+# At most this many verbatim turns (the newest) are sent, so history stays
+# bounded even if summary updates fall behind or fail.
+MEMORY_MAX_TURNS = int(os.environ.get("MEMORY_MAX_TURNS", "4"))
+MEMORY_WORKERS = int(os.environ.get("MEMORY_WORKERS", "1"))
+
+# ==========================================================
+# CONTEXT PACKING
+# ==========================================================
+# Chunks fetched from Chroma before redundancy removal and packing.
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", "20"))
+# Approximate prompt tokens spent on chunks plus their references.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+# MMR trade-off: 1.0 ranks by relevance only, lower values favour diversity.
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+# Candidates this similar to an already packed chunk are dropped as duplicates.
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", "0.92"))
+
+# ==========================================================
+# ANSWER CACHE
+# ==========================================================
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+# Minimum cosine similarity between query embeddings for a cache hit.
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+# Identical questions (same normalized text, mode and history) asked while one
+# is still being answered wait for that answer instead of generating their own.
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "1") == "1"
+
+# ==========================================================
+# DOCUMENT SUMMARIES
+# ==========================================================
+# Words per map piece. Pieces end on sentence/line boundaries chosen by
+# content, so an edit only changes the pieces around it.
+SUMMARY_CHUNK_WORDS = int(os.environ.get("SUMMARY_CHUNK_WORDS", "1400"))
+SUMMARY_MIN_CHUNK_WORDS = int(os.environ.get("SUMMARY_MIN_CHUNK_WORDS", "600"))
+SUMMARY_PIECE_WORDS = int(os.environ.get("SUMMARY_PIECE_WORDS", "120"))
+# Partial summaries combined per reduce call; more levels are added as needed.
+SUMMARY_FANOUT = int(os.environ.get("SUMMARY_FANOUT", "8"))
+# Map pieces are background LLM work, so at most LLM_BACKGROUND_CONCURRENCY of
+# them (fewer while memory or image prompts run) are generated at once, whatever
+# SUMMARY_MAP_WORKERS says. To summarize faster, raise LLM_CONCURRENCY and
+# LLM_BACKGROUND_CONCURRENCY together.
+SUMMARY_MAP_WORKERS = int(os.environ.get("SUMMARY_MAP_WORKERS", str(LLM_BACKGROUND_CONCURRENCY)))
+SUMMARY_JOB_WORKERS = int(os.environ.get("SUMMARY_JOB_WORKERS", "1"))
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "4096"))
+
+# ==========================================================
+# SPEECH TO TEXT
+# ==========================================================
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+# Frames quieter than this (dBFS) at the start/end of a clip are trimmed.
+VAD_THRESHOLD_DB = float(os.environ.get("VAD_THRESHOLD_DB", "-40"))
+# Recordings uploaded in chunks are transcribed in pieces of about this
+# many seconds while the user is still speaking, cut at the quietest moment.
+AUDIO_SEGMENT_SECONDS = float(os.environ.get("AUDIO_SEGMENT_SECONDS", "5"))
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", "1"))
+# Upload sessions that are not finished within this many seconds are dropped.
+AUDIO_SESSION_TTL = int(os.environ.get("AUDIO_SESSION_TTL", "600"))
+AUDIO_MAX_BYTES = int(os.environ.get("AUDIO_MAX_BYTES", str(25 * 1024 * 1024)))
+
+# ==========================================================
+# IMAGE GENERATION
+# ==========================================================
+SD_MODEL = os.environ.get("SD_MODEL", "runwayml/stable-diffusion-v1-5")
+# Used when no GPU is available.
+SD_CPU_STEPS = int(os.environ.get("SD_CPU_STEPS", "20"))
+SD_CPU_RESOLUTION = int(os.environ.get("SD_CPU_RESOLUTION", "384"))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "1"))
+# Generated images are stored here by content hash and served from /images/.
+IMAGE_DIR = os.environ.get("IMAGE_DIR", "./generated_images")
+# Thumbnail sizes (longest side, px) that may be requested; chat payloads link the first.
+IMAGE_THUMBNAIL_SIZES = [int(size) for size in os.environ.get("IMAGE_THUMBNAIL_SIZES", "256,128").split(",")]
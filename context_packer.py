@@ -0,0 +1,137 @@
+import ast
+import time
+
+import numpy as np
+
+import config
+
+
+def estimate_tokens(text):
+    """Rough prompt-token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def parse_references(metadata):
+    """Cited references stored with a chunk, as a list of dicts."""
+    raw = (metadata or {}).get("references")
+    if not raw:
+        return []
+    try:
+        references = ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return [{"raw_reference": raw}]
+    return references if isinstance(references, list) else [references]
+
+
+def reference_key(reference):
+    if isinstance(reference, dict):
+        return reference.get("raw_reference") or reference.get("citation_id") or str(reference)
+    return str(reference)
+
+
+def trim_overlap(text, packed, min_overlap=40):
+    """Strip the part of `text` that a packed neighbour already carries.
+
+    Chunks are split with a fixed overlap, so consecutive chunks share a run of
+    text at their boundary. Returns None if `text` is contained in a packed chunk.
+    """
+    for other in packed:
+        if text in other:
+            return None
+        # Our head repeats the other chunk's tail.
+        head = text[:min_overlap]
+        start = other.find(head)
+        while start != -1 and not text.startswith(other[start:]):
+            start = other.find(head, start + 1)
+        if start != -1:
+            text = text[len(other) - start:]
+        # Our tail repeats the other chunk's head.
+        tail = text[-min_overlap:]
+        end = other.find(tail)
+        if len(text) >= min_overlap and end != -1 and text.endswith(other[:end + min_overlap]):
+            text = text[:len(text) - (end + min_overlap)]
+        if len(text.strip()) < min_overlap:
+            return None
+    return text
+
+
+def _normalize(embeddings):
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_order(query_embedding, embeddings, mmr_lambda, duplicate_threshold):
+    """Yield candidate indices in maximal-marginal-relevance order, skipping near-duplicates."""
+    matrix = _normalize(embeddings)
+    query = _normalize(query_embedding)
+    relevance = matrix @ query
+    # Highest similarity of each candidate to anything already chosen.
+    redundancy = np.full(len(matrix), -1.0, dtype=np.float32)
+    remaining = np.ones(len(matrix), dtype=bool)
+
+    while remaining.any():
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * np.maximum(redundancy, 0)
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        remaining[best] = False
+        if redundancy[best] >= duplicate_threshold:
+            continue
+        yield best
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+
+
+def pack(query_embedding, documents, embeddings=None, metadatas=None, budget=None,
+         mmr_lambda=None, duplicate_threshold=None):
+    """Choose chunks for the prompt within a token budget.
+
+    Returns (chunks, references, stats): the packed chunk texts, the references
+    each packed chunk cites (listed once, under the first chunk that cites them)
+    and counts for logging. Candidates are assumed to be in retrieval order.
+    """
+    budget = config.CONTEXT_TOKEN_BUDGET if budget is None else budget
+    mmr_lambda = config.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    if duplicate_threshold is None:
+        duplicate_threshold = config.CONTEXT_DUPLICATE_THRESHOLD
+    metadatas = metadatas or [None] * len(documents)
+    start = time.time()
+
+    if embeddings is not None and len(embeddings) == len(documents) and len(documents):
+        order = mmr_order(query_embedding, embeddings, mmr_lambda, duplicate_threshold)
+    else:
+        order = iter(range(len(documents)))
+
+    chunks, references = [], []
+    seen_references = set()
+    used = 0
+    for index in order:
+        text = trim_overlap(documents[index], chunks)
+        if text is None:
+            continue
+        cited = []
+        for reference in parse_references(metadatas[index]):
+            key = reference_key(reference)
+            if key not in seen_references:
+                cited.append(reference)
+        cost = estimate_tokens(text) + sum(estimate_tokens(reference_key(r)) for r in cited)
+        # The best chunk always goes in, even if it is over budget on its own.
+        if chunks and used + cost > budget:
+            continue
+        chunks.append(text)
+        references.append(cited)
+        seen_references.update(reference_key(r) for r in cited)
+        used += cost
+
+    candidate_tokens = sum(estimate_tokens(text) for text in documents) + sum(
+        estimate_tokens(reference_key(r)) for metadata in metadatas for r in parse_references(metadata)
+    )
+    stats = {
+        "candidates": len(documents),
+        "packed": len(chunks),
+        "references": len(seen_references),
+        "tokens": used,
+        "candidate_tokens": candidate_tokens,
+        "pack_ms": round((time.time() - start) * 1000, 2)
+    }
+    return chunks, references, stats
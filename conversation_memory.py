@@ -0,0 +1,88 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+from LLM import get_result
+
+logger = logging.getLogger(__name__)
+
+# Older turns are folded into a per-conversation summary off the request path,
+# so the prompt carries the summary plus the turns it does not cover yet.
+_executor = ThreadPoolExecutor(max_workers=config.MEMORY_WORKERS, thread_name_prefix="memory")
+_lock = threading.Lock()
+_pending = {}
+# Turns folded into the summary per LLM call.
+BATCH_TURNS = 8
+
+
+def truncate_words(text, max_words):
+    words = (text or "").split()
+    if len(words) <= max_words:
+        return text or ""
+    return " ".join(words[:max_words]) + " ..."
+
+
+def history(store, user_id, conversation_id):
+    """Prompt history: the rolling summary (if any) and the answered turns after it, verbatim but capped.
+
+    Usually that is just the last turn; more appear while a summary update is
+    still running, up to the newest MEMORY_MAX_TURNS.
+    """
+    summary, upto = store.get_summary(user_id, conversation_id)
+    entries = []
+    if summary:
+        entries.append({"summary": summary})
+    for turn in store.completed_turns(user_id, conversation_id, after=upto, limit=config.MEMORY_MAX_TURNS):
+        entries.append({
+            "user": truncate_words(turn["user"], config.MEMORY_LAST_TURN_WORDS),
+            "bot": truncate_words(turn["bot"], config.MEMORY_LAST_TURN_WORDS)
+        })
+    return entries
+
+
+def _fold(store, user_id, conversation_id):
+    summary, upto = store.get_summary(user_id, conversation_id)
+    # The newest turn stays out of the summary; it is sent verbatim.
+    turns = store.completed_turns(user_id, conversation_id, after=upto)[:-1]
+    llm = get_result()
+    for start in range(0, len(turns), BATCH_TURNS):
+        batch = [
+            {
+                "user": truncate_words(turn["user"], config.MEMORY_LAST_TURN_WORDS),
+                "bot": truncate_words(turn["bot"], config.MEMORY_LAST_TURN_WORDS)
+            }
+            for turn in turns[start:start + BATCH_TURNS]
+        ]
+        new_summary = llm.update_conversation_summary(summary, batch, config.MEMORY_SUMMARY_WORDS)
+        new_upto = turns[start:start + BATCH_TURNS][-1]["id"]
+        if not store.set_summary(user_id, conversation_id, new_summary, new_upto, upto):
+            return  # the conversation was deleted or updated elsewhere
+        summary, upto = new_summary, new_upto
+
+
+def _run(store, key, request_id):
+    metrics.set_request_id(request_id)
+    while True:
+        try:
+            _fold(store, *key)
+        except Exception:
+            logger.exception("Conversation summary update failed")
+        with _lock:
+            # Turns that finished while we were summarizing need another pass.
+            if not _pending[key]:
+                del _pending[key]
+                return
+            _pending[key] = False
+
+
+def remember(store, user_id, conversation_id):
+    """Schedule a summary update after a turn is answered. Updates per conversation are coalesced."""
+    key = (user_id, conversation_id)
+    with _lock:
+        if key in _pending:
+            _pending[key] = True
+            return
+        _pending[key] = False
+    _executor.submit(_run, store, key, metrics.get_request_id())
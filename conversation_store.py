@@ -0,0 +1,259 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import config
+
+
+class ConversationStore(ABC):
+    """Server-side chat history. The Flask session only carries the user ID."""
+
+    @abstractmethod
+    def create_conversation(self, user_id, conversation_id, title, mode):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_conversation(self, user_id, conversation_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_conversations(self, user_id, limit=None, before=None, since=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def latest_conversation_id(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_conversation(self, user_id, conversation_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_message(self, user_id, conversation_id, user_message, title, image_job=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_bot_response(self, message_id, bot_response):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_image(self, image_job, image):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_messages(self, user_id, conversation_id, offset=0, limit=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_messages(self, user_id, conversation_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def recent_messages(self, user_id, conversation_id, limit):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_summary(self, user_id, conversation_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_summary(self, user_id, conversation_id, summary, upto, previous_upto):
+        raise NotImplementedError
+
+    @abstractmethod
+    def completed_turns(self, user_id, conversation_id, after=0, limit=None):
+        raise NotImplementedError
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    mode TEXT,
+    last_updated REAL NOT NULL,
+    summary TEXT,
+    summary_upto INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS conversations_by_update ON conversations (user_id, last_updated, id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    user TEXT,
+    bot TEXT,
+    image TEXT,
+    image_job TEXT,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (user_id, conversation_id, id);
+CREATE INDEX IF NOT EXISTS messages_by_image_job ON messages (image_job);
+"""
+
+class SQLiteConversationStore(ConversationStore):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers run alongside a writer.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_conversation(self, user_id, conversation_id, title, mode):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO conversations (user_id, id, title, mode, last_updated) VALUES (?, ?, ?, ?, ?)",
+                (user_id, conversation_id, title, mode, time.time())
+            )
+
+    def get_conversation(self, user_id, conversation_id):
+        row = self._connect().execute(
+            "SELECT id, title, mode, last_updated FROM conversations WHERE user_id = ? AND id = ?",
+            (user_id, conversation_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_conversations(self, user_id, limit=None, before=None, since=None):
+        """Newest first. `before` is a (last_updated, id) cursor; `since` keeps only later updates."""
+        query = "SELECT id, title, mode, last_updated FROM conversations WHERE user_id = ?"
+        params = [user_id]
+        if before is not None:
+            query += " AND (last_updated < ? OR (last_updated = ? AND id < ?))"
+            params += [before[0], before[0], before[1]]
+        if since is not None:
+            query += " AND last_updated > ?"
+            params.append(since)
+        query += " ORDER BY last_updated DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connect().execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest_conversation_id(self, user_id):
+        row = self._connect().execute(
+            "SELECT id FROM conversations WHERE user_id = ? ORDER BY last_updated DESC LIMIT 1",
+            (user_id,)
+        ).fetchone()
+        return row["id"] if row else None
+
+    def delete_conversation(self, user_id, conversation_id):
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM conversations WHERE user_id = ? AND id = ?", (user_id, conversation_id)
+            ).rowcount
+            conn.execute(
+                "DELETE FROM messages WHERE user_id = ? AND conversation_id = ?", (user_id, conversation_id)
+            )
+        return deleted > 0
+
+    def add_message(self, user_id, conversation_id, user_message, title, image_job=None):
+        """Append a turn and return its message ID. The first turn also titles the conversation."""
+        now = time.time()
+        with self._connect() as conn:
+            first = conn.execute(
+                "SELECT 1 FROM messages WHERE user_id = ? AND conversation_id = ? LIMIT 1",
+                (user_id, conversation_id)
+            ).fetchone() is None
+            message_id = conn.execute(
+                "INSERT INTO messages (user_id, conversation_id, user, image_job, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_id, conversation_id, user_message, image_job, now)
+            ).lastrowid
+            if first:
+                conn.execute(
+                    "UPDATE conversations SET title = ?, last_updated = ? WHERE user_id = ? AND id = ?",
+                    (title, now, user_id, conversation_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE conversations SET last_updated = ? WHERE user_id = ? AND id = ?",
+                    (now, user_id, conversation_id)
+                )
+        return message_id
+
+    def set_bot_response(self, message_id, bot_response):
+        with self._connect() as conn:
+            conn.execute("UPDATE messages SET bot = ? WHERE id = ?", (bot_response, message_id))
+            conn.execute(
+                "UPDATE conversations SET last_updated = ? WHERE (user_id, id) = "
+                "(SELECT user_id, conversation_id FROM messages WHERE id = ?)",
+                (time.time(), message_id)
+            )
+
+    def set_image(self, image_job, image):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE messages SET image = ? WHERE image_job = ? AND image IS NULL", (image, image_job)
+            )
+
+    @staticmethod
+    def _message(row):
+        return {k: row[k] for k in ("user", "bot", "image", "image_job", "timestamp") if row[k] is not None}
+
+    def get_messages(self, user_id, conversation_id, offset=0, limit=None):
+        rows = self._connect().execute(
+            "SELECT * FROM messages WHERE user_id = ? AND conversation_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (user_id, conversation_id, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return [self._message(row) for row in rows]
+
+    def count_messages(self, user_id, conversation_id):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM messages WHERE user_id = ? AND conversation_id = ?",
+            (user_id, conversation_id)
+        ).fetchone()[0]
+
+    def recent_messages(self, user_id, conversation_id, limit):
+        rows = self._connect().execute(
+            "SELECT * FROM messages WHERE user_id = ? AND conversation_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, conversation_id, limit)
+        ).fetchall()
+        return [self._message(row) for row in reversed(rows)]
+
+    def get_summary(self, user_id, conversation_id):
+        """The rolling summary and the ID of the last message folded into it."""
+        row = self._connect().execute(
+            "SELECT summary, summary_upto FROM conversations WHERE user_id = ? AND id = ?",
+            (user_id, conversation_id)
+        ).fetchone()
+        return (row["summary"] or "", row["summary_upto"]) if row else ("", 0)
+
+    def set_summary(self, user_id, conversation_id, summary, upto, previous_upto):
+        """Store a new summary unless another update got there first."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE conversations SET summary = ?, summary_upto = ? "
+                "WHERE user_id = ? AND id = ? AND summary_upto = ?",
+                (summary, upto, user_id, conversation_id, previous_upto)
+            ).rowcount > 0
+
+    def completed_turns(self, user_id, conversation_id, after=0, limit=None):
+        """Answered turns with an ID above `after`, oldest first, including their IDs.
+
+        With `limit`, only the most recent `limit` of them are returned.
+        """
+        rows = self._connect().execute(
+            "SELECT id, user, bot FROM messages WHERE user_id = ? AND conversation_id = ? "
+            "AND id > ? AND bot IS NOT NULL ORDER BY id DESC LIMIT ?",
+            (user_id, conversation_id, after, -1 if limit is None else limit)
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+
+def create_store():
+    if config.CONVERSATION_STORE == "sqlite":
+        return SQLiteConversationStore(config.CONVERSATION_DB)
+    raise ValueError(f"Unknown conversation store: {config.CONVERSATION_STORE}")
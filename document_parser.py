@@ -0,0 +1,201 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+
+import config
+import metrics
+
+# Parsing is CPU-bound, so independent files (and page ranges of large PDFs)
+# are spread over a process pool. Everything here is module-level so it can
+# be pickled into the workers.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=config.PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def _timed(function, *args):
+    # Runs in the worker; the parent records the time so it lands in its metrics.
+    start = time.perf_counter()
+    return function(*args), time.perf_counter() - start
+
+
+def extract_references_from_text(full_text):
+    keywords = ["References", "REFERENCES", "references"]
+    start = -1
+    for keyword in keywords:
+        start = full_text.find(keyword)
+        if start != -1:
+            break
+    if start != -1:
+        return full_text[start:]#.split("\n")
+    return ""
+
+
+def read_bytes(file):
+    file.seek(0)
+    return file.read()
+
+
+def iter_pdf_pages(source, start=0, stop=None):
+    """Yield the text of each page in [start, stop) of PDF bytes or a PDF path, without holding the others."""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for page_num in range(start, stop):
+        yield reader.pages[page_num].extract_text() or ""
+
+
+def extract_pdf_range(path, start, stop):
+    return "".join(iter_pdf_pages(path, start, stop))
+
+
+def pdf_page_count(data):
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+
+
+def read_pdf(data):
+    whole_text = " " + "".join(iter_pdf_pages(data))
+    return whole_text, extract_references_from_text(whole_text)
+
+
+def read_txt(data):
+    for encoding in ["utf-8", "latin-1", "windows-1252"]:
+        try:
+            full_text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError("Unable to decode text file.")
+
+    return full_text, extract_references_from_text(full_text)
+
+
+def read_docx(data):
+    from docx import Document
+
+    doc = Document(io.BytesIO(data))
+    full_text = "\n".join(para.text for para in doc.paragraphs)
+    return full_text, extract_references_from_text(full_text)
+
+
+def read_spreadsheet(filename, data):
+    import pandas as pd
+
+    ext = filename.rsplit('.', 1)[1].lower()
+    if ext == 'csv':
+        df = pd.read_csv(io.BytesIO(data))
+    elif ext in ['xls', 'xlsx']:
+        df = pd.read_excel(io.BytesIO(data))
+    else:
+        raise ValueError("Unsupported spreadsheet format")
+
+    # Convert to CSV string (no index column)
+    return df.to_csv(index=False), []
+
+
+def parse_file(filename, data):
+    """Return (text, references) for one uploaded file."""
+    ext = filename.rsplit('.', 1)[-1].lower()
+    if ext == 'pdf':
+        return read_pdf(data)
+    elif ext == 'txt':
+        return read_txt(data)
+    elif ext == 'docx':
+        return read_docx(data)
+    elif ext in ['csv', 'xls', 'xlsx']:
+        return read_spreadsheet(filename, data)
+    raise ValueError(f"Unsupported file type: {filename}")
+
+
+def pdf_page_ranges(filename, data):
+    """Page ranges for PDFs large enough to split across workers, else None."""
+    if not filename.lower().endswith('.pdf'):
+        return None
+    try:
+        pages = pdf_page_count(data)
+    except Exception:
+        return None  # let the worker report the parse error
+    size = config.PDF_PAGES_PER_TASK
+    if pages <= size:
+        return None
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)]
+
+
+def _spill(data):
+    # Split PDFs are written to disk once and each worker opens its page range
+    # from the path, instead of every task pickling its own copy of the file.
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def parse_files(files):
+    """Parse `files` in parallel, yielding (index, text, references, error) as each one finishes."""
+    pool = get_pool()
+    pending = {}
+    parts = {}
+    split = {}  # index -> temporary PDF path
+
+    try:
+        for index, file in enumerate(files):
+            data = read_bytes(file)
+            ranges = pdf_page_ranges(file.filename, data)
+            if ranges:
+                split[index] = path = _spill(data)
+                parts[index] = [None] * len(ranges)
+                for part, (start, stop) in enumerate(ranges):
+                    pending[pool.submit(_timed, extract_pdf_range, path, start, stop)] = (index, part)
+            else:
+                parts[index] = [None]
+                pending[pool.submit(_timed, parse_file, file.filename, data)] = (index, 0)
+            del data
+
+        remaining = {index: len(p) for index, p in parts.items()}
+        failed = set()
+        for future in as_completed(pending):
+            index, part = pending[future]
+            if index in failed:
+                continue
+            try:
+                parts[index][part], seconds = future.result()
+                metrics.observe("parse", seconds)
+            except Exception as e:
+                failed.add(index)
+                yield index, None, None, e
+                continue
+
+            remaining[index] -= 1
+            if remaining[index]:
+                continue
+            if index in split:
+                text = " " + "".join(parts.pop(index))
+                yield index, text, extract_references_from_text(text), None
+            else:
+                text, references = parts.pop(index)[0]
+                yield index, text, references, None
+    finally:
+        for future in pending:
+            future.cancel()
+        wait(pending)
+        for path in split.values():
+            os.unlink(path)
@@ -0,0 +1,211 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+import backpressure
+import config
+import metrics
+import registry
+
+
+def _load_torch(name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def _load_int8(name):
+    import torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(name, device="cpu")
+    # Nearly all of MiniLM's compute is in its Linear layers; int8 weights there give most of the speed-up.
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(name):
+    from sentence_transformers import SentenceTransformer
+    model_kwargs = {"file_name": config.EMBEDDING_ONNX_FILE} if config.EMBEDDING_ONNX_FILE else {}
+    return SentenceTransformer(name, backend="onnx", model_kwargs=model_kwargs)
+
+
+# Every backend returns an object with SentenceTransformer's `encode(texts, batch_size=...)`.
+BACKENDS = {
+    "torch": _load_torch,
+    "int8": _load_int8,
+    "onnx": _load_onnx,
+}
+
+
+def load_model(backend=None, name=None):
+    """Build the embedding model for `backend` (default EMBEDDING_BACKEND)."""
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[backend](name or config.EMBEDDING_MODEL)
+
+
+class EmbeddingCache:
+    """LRU map from chunk content hash to its embedding."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = EmbeddingCache(config.EMBEDDING_CACHE_SIZE)
+
+
+# Priorities: interactive queries are encoded before queued ingestion batches.
+QUERY = 0
+BULK = 1
+
+
+class EmbeddingService:
+    """Gathers texts from concurrent callers into shared batched encode calls.
+
+    A dispatcher waits up to `window` seconds (or until `max_batch` texts are
+    queued) after the first request, then encodes everything it gathered in one
+    forward pass, queries first. Bulk submissions are split into `max_batch`
+    pieces so a query never waits behind a whole document.
+    """
+
+    def __init__(self, max_batch, window, dispatchers, max_queued_queries):
+        self.max_batch = max_batch
+        self.window = window
+        self.dispatchers = dispatchers
+        self.max_queued_queries = max_queued_queries
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq, texts, future)
+        self._seq = itertools.count()
+        self._queued_texts = 0
+        self._queued_queries = 0
+        self._threads = []
+        self._batches = 0
+        self._texts = 0
+        # Moving average of one encode call, for Retry-After.
+        self._batch_seconds = 0.05
+
+    def _start(self):
+        # Called with the lock held.
+        while len(self._threads) < self.dispatchers:
+            thread = threading.Thread(target=self._dispatch, name=f"embed-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, texts, priority=QUERY):
+        """Queue `texts` and return futures for their embedding arrays, one per piece of up to `max_batch`."""
+        futures = []
+        with self._cond:
+            if priority == QUERY and backpressure.is_interactive() and self._queued_queries >= self.max_queued_queries:
+                retry_after = max(1, math.ceil(self._batch_seconds * (self._queued_texts / self.max_batch + 1)))
+                raise backpressure.Overloaded("embedder", retry_after)
+            self._start()
+            for start in range(0, len(texts), self.max_batch):
+                piece = list(texts[start:start + self.max_batch])
+                future = Future()
+                heapq.heappush(self._queue, (priority, next(self._seq), piece, future))
+                self._queued_texts += len(piece)
+                if priority == QUERY:
+                    self._queued_queries += 1
+                futures.append(future)
+            self._cond.notify_all()
+        return futures
+
+    def encode(self, texts, priority=QUERY):
+        """Embeddings for `texts` as one float32 array, in order."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([future.result() for future in self.submit(texts, priority)])
+
+    def encode_one(self, text, priority=QUERY):
+        return self.submit([text], priority)[0].result()[0]
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # Give concurrent callers a moment to join, unless there is already a full batch.
+            deadline = time.monotonic() + self.window
+            while self._queued_texts < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self._queue:
+                return []  # another dispatcher took it
+
+            batch = []
+            size = 0
+            while self._queue and (not batch or size + len(self._queue[0][2]) <= self.max_batch):
+                priority, _, texts, future = heapq.heappop(self._queue)
+                batch.append((texts, future))
+                size += len(texts)
+                self._queued_texts -= len(texts)
+                if priority == QUERY:
+                    self._queued_queries -= 1
+            return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            texts = [text for piece, _ in batch for text in piece]
+            start = time.perf_counter()
+            try:
+                with metrics.span("embed_batch"):
+                    vectors = np.asarray(registry.get_embedding_model().encode(texts, batch_size=len(texts)),
+                                         dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            with self._cond:
+                self._batch_seconds = 0.8 * self._batch_seconds + 0.2 * elapsed
+                self._batches += 1
+                self._texts += len(texts)
+            offset = 0
+            for piece, future in batch:
+                future.set_result(vectors[offset:offset + len(piece)])
+                offset += len(piece)
+
+    def status(self):
+        with self._cond:
+            return {
+                "queued_texts": self._queued_texts,
+                "queued_queries": self._queued_queries,
+                "batches": self._batches,
+                "mean_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            }
+
+
+service = EmbeddingService(
+    max_batch=config.EMBED_BATCH_SIZE,
+    window=config.EMBED_BATCH_WINDOW_MS / 1000,
+    dispatchers=config.EMBED_CONCURRENCY,
+    max_queued_queries=config.EMBED_QUEUE
+)
@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import backpressure
+import config
+import image_store
+import metrics
+from jobs import JobRegistry
+from LLM import get_result
+
+logger = logging.getLogger(__name__)
+
+# Image generation runs in the background so the text answer can be returned
+# right away. The frontend polls the job until the image is ready. Admitted jobs
+# each get a thread and wait on the image limiter, so its queue length is the backlog.
+_executor = ThreadPoolExecutor(max_workers=config.IMAGE_WORKERS + config.IMAGE_QUEUE, thread_name_prefix="image")
+_lock = threading.Lock()
+_jobs = JobRegistry(hidden=('text',))
+_images_by_summary = OrderedDict()
+_listeners = []
+MAX_CACHED_IMAGES = 64
+
+
+def add_listener(callback):
+    """Call `callback(job_id, image_url)` whenever a job finishes successfully."""
+    _listeners.append(callback)
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _prune(entries, limit, finished):
+    # Oldest entries first; anything still in progress is kept.
+    for key in list(entries):
+        if len(entries) <= limit:
+            break
+        if finished(entries[key]):
+            del entries[key]
+
+
+def render(summary):
+    """Generate an image for `summary` and return its image_store digest, sharing work between identical summaries."""
+    key = _hash(summary)
+    with _lock:
+        future = _images_by_summary.get(key)
+        owner = future is None
+        if owner:
+            future = _images_by_summary[key] = Future()
+            _prune(_images_by_summary, MAX_CACHED_IMAGES, lambda f: f.done())
+
+    if not owner:
+        return future.result()
+
+    try:
+        digest = image_store.save(get_result().call_stable_diffusion(summary))
+    except Exception as e:
+        with _lock:
+            del _images_by_summary[key]
+        future.set_exception(e)
+        raise
+    future.set_result(digest)
+    return digest
+
+
+def generate(text):
+    summary = get_result().llama_summarize(text=text)
+    logger.debug("Image prompt summary: %s", summary)
+    return render(summary)
+
+
+def _run(job):
+    metrics.set_request_id(job['request_id'])
+    try:
+        with backpressure.IMAGE.slot():
+            _jobs.update(job, status='running')
+            digest = generate(job['text'])
+        _jobs.finish(job, image=image_store.url(digest),
+                     thumbnail=image_store.url(digest, config.IMAGE_THUMBNAIL_SIZES[0]))
+    except Exception as e:
+        logger.exception("Image generation failed")
+        _jobs.finish(job, error=e)
+
+    if job['status'] == 'done':
+        for callback in _listeners:
+            try:
+                callback(job['id'], job['image'])
+            except Exception:
+                logger.exception("Image job listener failed")
+
+
+def submit(text):
+    """Queue an image for `text` and return the job ID. Repeated texts share one job.
+
+    Raises backpressure.Overloaded if the image queue is full.
+    """
+    job_id = _hash(text)[:16]
+    job, created = _jobs.add(job_id, admit=backpressure.IMAGE.check, text=text, image=None, thumbnail=None)
+    if created:
+        _executor.submit(_run, job)
+    return job_id
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
@@ -0,0 +1,73 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+import config
+
+# Generated images are written once, named by the SHA-256 of their PNG bytes,
+# and served by URL. A name always refers to the same bytes, so responses can
+# be cached forever and concurrent jobs never overwrite each other's files.
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _path(digest, size=None):
+    name = f"{digest}.png" if size is None else f"{digest}_{size}.png"
+    return os.path.join(config.IMAGE_DIR, digest[:2], name)
+
+
+def _write(path, data):
+    # Write to a temporary file and rename, so readers never see a partial image.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def put(data):
+    """Store PNG bytes and return their digest. Storing the same bytes again is a no-op."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _path(digest)
+    if not os.path.exists(path):
+        _write(path, data)
+    return digest
+
+
+def save(image):
+    """Store a PIL image as PNG and return its digest."""
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return put(buf.getvalue())
+
+
+def url(digest, size=None):
+    if size is None:
+        return f"/images/{digest}.png"
+    return f"/images/{digest}/{size}.png"
+
+
+def path(digest, size=None):
+    """File path of a stored image, or of its `size` px thumbnail (made on first use). None if unknown."""
+    if not _DIGEST.match(digest) or (size is not None and size not in config.IMAGE_THUMBNAIL_SIZES):
+        return None
+    original = _path(digest)
+    if not os.path.exists(original):
+        return None
+    if size is None:
+        return original
+
+    thumbnail = _path(digest, size)
+    if not os.path.exists(thumbnail):
+        from PIL import Image
+        with Image.open(original) as image:
+            image.thumbnail((size, size))
+            buf = io.BytesIO()
+            image.save(buf, format="PNG")
+        _write(thumbnail, buf.getvalue())
+    return thumbnail
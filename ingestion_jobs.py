@@ -0,0 +1,84 @@
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import config
+import document_parser
+import metrics
+from jobs import JobRegistry
+from allclassesgood import Chroma
+
+logger = logging.getLogger(__name__)
+
+# Uploads are ingested in the background so request workers stay free for
+# chat traffic. The frontend polls the job for per-file progress.
+_executor = ThreadPoolExecutor(max_workers=config.INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs = JobRegistry()
+
+
+class UploadedFile(io.BytesIO):
+    """In-memory copy of an uploaded file; the request's stream is closed once it returns."""
+
+    def __init__(self, filename, data):
+        super().__init__(data)
+        self.filename = filename
+
+
+def _update(entry, stage, **counts):
+    _jobs.update(entry, stage=stage, **counts)
+
+
+def _ingest(job, files):
+    chroma = Chroma(mode=job['mode'])
+    for entry in job['files']:
+        _update(entry, 'parsing')
+
+    # Files come back from the parser pool in completion order.
+    for index, text, references, error in document_parser.parse_files(files):
+        entry = job['files'][index]
+        try:
+            if error is not None:
+                raise error
+            stats = chroma.insert_text(text, references, lambda stage, **counts: _update(entry, stage, **counts))
+            _update(entry, 'done', **stats)
+        except Exception as e:
+            logger.exception("Ingestion of %s failed", entry['name'])
+            _update(entry, 'failed', error=str(e))
+
+
+def _run(job, files):
+    metrics.set_request_id(job['request_id'])
+    _jobs.update(job, status='running')
+    try:
+        _ingest(job, files)
+    except Exception as e:
+        # Setup failed (embedding model, vector DB, parser pool): fail every file not yet finished.
+        logger.exception("Ingestion job %s failed", job['id'])
+        with _jobs.lock:
+            for entry in job['files']:
+                if entry['stage'] not in ('done', 'failed'):
+                    entry['error'] = str(e)
+                    entry['stage'] = 'failed'
+
+    with _jobs.lock:
+        failed = [entry for entry in job['files'] if entry['stage'] == 'failed']
+        job['status'] = 'failed' if failed else 'done'
+        job['finished'] = time.time()
+
+
+def submit(files, mode):
+    """Queue uploaded files for ingestion and return the job ID."""
+    files = [UploadedFile(file.filename, file.read()) for file in files]
+    job, _ = _jobs.add(
+        uuid4().hex,
+        mode=mode,
+        files=[{'name': file.filename, 'stage': 'queued', 'error': None} for file in files]
+    )
+    _executor.submit(_run, job, files)
+    return job['id']
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
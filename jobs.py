@@ -0,0 +1,75 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+MAX_JOBS = 256
+FINISHED = ('done', 'failed')
+
+
+class JobRegistry:
+    """Background jobs by ID, polled by the frontend.
+
+    Keeps about `max_jobs` jobs: once over the limit the oldest finished ones are
+    dropped, jobs still queued or running are kept. `lock` guards every job
+    dict; update jobs under it so readers never see a half-written one.
+    """
+
+    def __init__(self, max_jobs=MAX_JOBS, hidden=()):
+        self.lock = threading.Lock()
+        self.max_jobs = max_jobs
+        # Fields kept off the polled copy; the request ID is for logs only.
+        self.hidden = {'request_id', *hidden}
+        self._jobs = OrderedDict()
+
+    def add(self, job_id, admit=None, **fields):
+        """Register a queued job and return (job, created).
+
+        A job with the same ID that has not failed is returned as is, so
+        identical inputs share one job. Otherwise `admit()` (which may raise)
+        is called before the new job is stored.
+        """
+        with self.lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] != 'failed':
+                return job, False
+            if admit is not None:
+                admit()
+            job = self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'error': None,
+                'created': time.time(),
+                'finished': None,
+                'request_id': metrics.get_request_id(),
+                **fields
+            }
+            for key in list(self._jobs):
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                if self._jobs[key]['status'] in FINISHED:
+                    del self._jobs[key]
+            return job, True
+
+    def update(self, job, **fields):
+        with self.lock:
+            job.update(fields)
+
+    def finish(self, job, error=None, **fields):
+        """Mark `job` done, or failed with `error`."""
+        with self.lock:
+            job.update(fields)
+            if error is not None:
+                job['error'] = str(error)
+            job['status'] = 'failed' if error is not None else 'done'
+            job['finished'] = time.time()
+
+    def get(self, job_id):
+        """A copy of the job without its hidden fields, or None."""
+        with self.lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return copy.deepcopy({k: v for k, v in job.items() if k not in self.hidden})
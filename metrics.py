@@ -0,0 +1,114 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+# Per-stage timings exported in the Prometheus text format on /metrics, plus the
+# request ID that ties log lines from one request (and its background work) together.
+_request_id = contextvars.ContextVar("request_id", default="-")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(request_id):
+    _request_id.set(request_id or "-")
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = get_request_id()
+        return True
+
+
+def configure_logging(level=None):
+    """Send app logs to stderr with the level from LOG_LEVEL and the current request ID."""
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel((level or config.LOG_LEVEL).upper())
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values."""
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+
+    def totals(self):
+        """(count, sum) per label-value tuple."""
+        with self._lock:
+            return {key: (sum(s["counts"]), s["sum"]) for key, s in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: {"counts": list(s["counts"]), "sum": s["sum"]} for key, s in self._series.items()}
+        for label_values, data in sorted(series.items()):
+            labels = [f'{name}="{value}"' for name, value in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {data['sum']}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds",
+    "Time spent per pipeline stage (parse, chunk, embed, vector_query, prompt_build, llm, transcribe, image).",
+    labels=("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds",
+    "HTTP request latency until the response (or the first byte of a stream) is returned.",
+    labels=("endpoint", "method", "status")
+)
+_histograms = [STAGE_SECONDS, REQUEST_SECONDS]
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    logger.debug("stage=%s seconds=%.4f", stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as `stage`. Failed blocks are recorded too."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def render():
+    return "\n".join(histogram.render() for histogram in _histograms) + "\n"
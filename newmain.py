@@ -1,46 +1,92 @@
 from allclassesgood import Chroma
-from uuid import uuid4
-import os
 from voicetotext import transcribe
-import io
-import base64
-from LLM import get_result
+import image_jobs
+import image_store
+import answer_cache
+import config
+import singleflight
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def save_brief(text):
+    with open("policy brief.txt", "w", encoding="utf-8") as file:
+        file.write(text)
+
+def lookup_answer(chroma, query_embedding):
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    return answer_cache.cache.lookup(chroma.collection_name, query_embedding)
+
+def store_answer(chroma, query_embedding, answer, sources, latency, version):
+    if config.ANSWER_CACHE_ENABLED and answer:
+        answer_cache.cache.store(chroma.collection_name, query_embedding, answer, sources, latency, version)
+
+def log_llm_latency(chroma, seconds):
+    # Paired with the packing line from search_documents to compare prompt size and latency.
+    stats = getattr(chroma, "context_stats", {})
+    logger.info("LLM answered in %.2fs with ~%s context tokens (%s chunks)",
+                seconds, stats.get('tokens', '?'), stats.get('packed', '?'))
+
+def answer(flight, user_text, mode, chat_history):
+    """Retrieve and generate into `flight`; runs once for identical questions in flight together."""
+    chroma = Chroma(mode=mode)
+    query_embedding = chroma.embed_query(user_text)
+    # The prompt includes the conversation so far, so only answers to questions
+    # asked without history are shared through the cache.
+    cacheable = not chat_history
+    cached = lookup_answer(chroma, query_embedding) if cacheable else None
+    if cached is not None:
+        flight.set_sources(cached['sources'])
+        flight.append(cached['answer'])
+        return
+
+    version = answer_cache.cache.version(chroma.collection_name)
+    start = time.time()
+    context, ref = chroma.search_documents(user_text, query_embedding)
+    flight.set_sources(ref)
+
+    parts = []
+    llm_start = time.time()
+    for token in chroma.stream_llm(context, user_text, chat_history, ref):
+        parts.append(token)
+        flight.append(token)
+    log_llm_latency(chroma, time.time() - llm_start)
+    if cacheable:
+        store_answer(chroma, query_embedding, "".join(parts), ref, time.time() - start, version)
+
+def ask(user_text, mode, chat_history):
+    """The Flight answering this question, shared with identical questions already being answered."""
+    return singleflight.run(
+        singleflight.key(user_text, mode, chat_history),
+        lambda flight: answer(flight, user_text, mode, chat_history)
+    )
 
 def newfunc(user_text, action, mode, chat_history, files=None, path=None):
     text = ""
     chroma = Chroma(mode= mode)
     if action == "insert":
-        print("Files in insert: ", files)
+        logger.info("Files in insert: %s", [file.filename for file in files])
         chroma.files = files
-        chroma.insert_docs()
+        return chroma.insert_docs()
     elif action == "search":
-        print("User Text: ",user_text)
-        context, ref = chroma.search_documents(user_text)
-        text = chroma.call_llm(context, user_text, chat_history, ref)
-        with open("policy brief.txt", "w", encoding="utf-8") as file:
-            file.write(text)
-            return text
+        logger.debug("User Text: %s", user_text)
+        text = ask(user_text, mode, chat_history).text()
+        save_brief(text)
+        return text
+    elif action == "stream":
+        # Sources are known before generation starts; tokens follow lazily.
+        logger.debug("User Text: %s", user_text)
+        flight = ask(user_text, mode, chat_history)
+        return flight.sources(), flight.tokens()
     elif action == "audio":
-        
-        filename = f"audio_{uuid4()}.wav"
-        filenamecopy = filename
-        filepath = os.path.join("uploads", filename)
-        os.makedirs("uploads", exist_ok=True)
-        with open(filepath, "wb") as f:
-            f.write(user_text)
-        user_message = transcribe(filepath)
+        # Decoded straight from the request bytes, nothing is written to disk.
+        user_message = transcribe(user_text)
         
         return user_message
     elif action == "image":
-        summary = get_result().llama_summarize(text = user_text)
-        print("Summary: ", summary)
-        image = get_result().call_stable_diffusion(summary)
-        buf = io.BytesIO()
-        image.save(buf, format='PNG')
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        
-        return image_base64
+        return image_store.url(image_jobs.generate(user_text))
     
     else:
         return text
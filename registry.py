@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of heavy objects (embedding model, DB client, collection
+# handles, ...). Everything is loaded once per worker and shared by all
+# request threads. Each name is built under its own lock, so a slow load
+# (Whisper, Stable Diffusion) never blocks other loads or status(); the
+# global lock only guards the dicts and is never held while loading.
+_lock = threading.Lock()
+_load_locks = {}
+_models = {}
+_load_times = {}
+_collections = {}
+
+COLLECTIONS = {
+    "pakistan": "disaster_papers_pakistan",
+    "internet": "disaster_papers_internet",
+    "hybrid": "disaster_papers_hybrid",
+}
+
+
+def collection_name_for_mode(mode):
+    return COLLECTIONS.get(mode, COLLECTIONS["pakistan"])
+
+
+def get_model(name, factory):
+    """Return the object registered under `name`, building it with `factory` on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _load_lock(name):
+        if name not in _models:
+            start = time.time()
+            model = factory()
+            with _lock:
+                _models[name] = model
+                _load_times[name] = time.time() - start
+            logger.info("Loaded %s in %.2fs", name, _load_times[name])
+        return _models[name]
+
+
+def _load_lock(name):
+    with _lock:
+        lock = _load_locks.get(name)
+        if lock is None:
+            lock = _load_locks[name] = threading.Lock()
+        return lock
+
+
+def register_model(name, model):
+    """Install a ready-made object under `name` (e.g. a stand-in for tests)."""
+    with _lock:
+        _models[name] = model
+        _load_times[name] = 0.0
+        _collections.clear()
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def get_embedding_model():
+    def load():
+        import embeddings
+        return embeddings.load_model()
+
+    return get_model("embedding_model", load)
+
+
+def get_chroma_client():
+    def load():
+        import chromadb
+        return chromadb.PersistentClient(path=config.CHROMA_PATH)  # Local storage
+
+    return get_model("chroma_client", load)
+
+
+def get_collection(name):
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+    with _load_lock(f"collection:{name}"):
+        if name not in _collections:
+            collection = get_chroma_client().get_or_create_collection(name=name)
+            with _lock:
+                _collections[name] = collection
+        return _collections[name]
+
+
+def warm_up():
+    get_embedding_model()
+    get_chroma_client()
+    for name in COLLECTIONS.values():
+        get_collection(name)
+
+
+def status():
+    with _lock:
+        models = {name: round(seconds, 3) for name, seconds in _load_times.items()}
+        collections = sorted(_collections)
+    return {
+        "ready": is_loaded("embedding_model") and is_loaded("chroma_client"),
+        "models": models,
+        "collections": collections,
+    }
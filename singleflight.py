@@ -0,0 +1,121 @@
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import threading
+import uuid
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Identical questions asked at the same time (same normalized text, mode and
+# history) share one retrieval and one generation. The work runs on its own
+# thread and records tokens as they arrive, so any number of requests can
+# follow it, join late, or disconnect without affecting the others.
+_lock = threading.Lock()
+_flights = {}
+_coalesced = 0
+
+
+class Flight:
+    """One in-flight answer: its sources, the tokens so far, and how it ended."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._sources = None
+        self._has_sources = False
+        self._tokens = []
+        self._done = False
+        self._error = None
+
+    def set_sources(self, sources):
+        with self._cond:
+            self._sources = sources
+            self._has_sources = True
+            self._cond.notify_all()
+
+    def append(self, token):
+        with self._cond:
+            self._tokens.append(token)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self._error = error
+            self._done = True
+            self._cond.notify_all()
+
+    def sources(self):
+        """Block until retrieval is done and return the sources."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._has_sources or self._done)
+            if self._error is not None:
+                raise self._error
+            return self._sources
+
+    def tokens(self):
+        """Yield every token from the start, then new ones as they arrive."""
+        position = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: position < len(self._tokens) or self._done)
+                new = self._tokens[position:]
+                done, error = self._done, self._error
+            yield from new
+            position += len(new)
+            if done and position == len(self._tokens):
+                if error is not None:
+                    raise error
+                return
+
+    def text(self):
+        """Block until the answer is complete and return it."""
+        return "".join(self.tokens())
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip("?!. ")
+
+
+def key(query, mode, history):
+    fingerprint = hashlib.sha256(json.dumps(history, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return (normalize(query), mode, fingerprint)
+
+
+def _fly(flight_key, flight, work):
+    try:
+        work(flight)
+    except Exception as e:
+        logger.exception("Answer generation failed")
+        flight.finish(e)
+    else:
+        flight.finish()
+    finally:
+        with _lock:
+            _flights.pop(flight_key, None)
+
+
+def run(flight_key, work):
+    """Return the in-flight Flight for `flight_key`, or start `work(flight)` on a new thread."""
+    global _coalesced
+    if not config.COALESCE_REQUESTS:
+        flight_key = uuid.uuid4().hex
+    with _lock:
+        flight = _flights.get(flight_key)
+        if flight is not None:
+            _coalesced += 1
+            logger.info("Joined an identical question already in flight")
+            return flight
+        flight = _flights[flight_key] = Flight()
+    # The copied context carries the request ID and the request's backpressure behaviour.
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_fly, flight_key, flight, work),
+                     name="answer", daemon=True).start()
+    return flight
+
+
+def stats():
+    with _lock:
+        return {"in_flight": len(_flights), "coalesced": _coalesced}
@@ -12,6 +12,10 @@
     let currentConversationId = null;
     let currentMode = 'pakistan';
 
+    // Sidebar listing cache, kept in sync with ?since= delta requests
+    const sidebarConversations = new Map();
+    let sidebarSince = null;
+
     initializeChat();
 
     sendButton.addEventListener('click', sendMessage);
@@ -56,15 +60,20 @@
             const result = await response.json();
             
             if (!response.ok) {
-                throw new Error(result.message || 'Upload failed');
+                throw new Error(result.error || result.message || 'Upload failed');
             }
 
-            if (result.status === 'success') {
-                addMessage('system', result.message);
-                console.log('Upload successful:', result);
-            } else {
-                throw new Error(result.message || 'Upload completed with errors');
+            addMessage('system', result.message);
+            const job = await waitForUploadJob(result.job_id);
+
+            for (const file of job.files) {
+                if (file.stage === 'failed') {
+                    addMessage('system', `${file.name}: failed (${file.error})`);
+                } else {
+                    addMessage('system', `${file.name}: ${file.chunks} chunks stored (${file.embedded} newly embedded, ${file.reused + file.skipped} reused)`);
+                }
             }
+            console.log('Upload finished:', job);
         } catch (error) {
             console.error('Upload error:', error);
             addMessage('system', error.message);
@@ -73,6 +82,28 @@
         }
     }
 
+    // Poll an ingestion job until every file is done or failed
+    async function waitForUploadJob(jobId, interval = 2000) {
+        let lastStatus = '';
+        while (true) {
+            const response = await fetch(`/api/upload/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || 'Upload status unavailable');
+            }
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+
+            const status = job.files.map(file => `${file.name}: ${file.stage}`).join(', ');
+            if (status !== lastStatus) {
+                console.log('Upload progress:', status);
+                lastStatus = status;
+            }
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
+
     // Add message to UI
     function addMessage(sender, text, timestamp = null) {
         const messageDiv = document.createElement('div');
@@ -98,9 +129,108 @@
         
         chatOutput.appendChild(messageDiv);
         chatOutput.scrollTop = chatOutput.scrollHeight;
+        return textDiv;
+    }
+
+    // Read a server-sent event stream, calling handlers[event](data) per event
+    async function readEventStream(response, handlers) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (handlers[event]) handlers[event](JSON.parse(data));
+            }
+        }
+    }
+
+    // Render a streamed bot reply token by token; resolves with the full text
+    async function streamBotReply(response, onTranscript = null) {
+        let textDiv = null;
+        let reply = '';
+        let finished = null;
+
+        await readEventStream(response, {
+            transcript: (data) => onTranscript && onTranscript(data.user_message),
+            sources: () => {
+                textDiv = addMessage('bot', '');
+            },
+            token: (data) => {
+                reply += data.token;
+                textDiv.innerHTML = formatBotResponse(reply);
+                chatOutput.scrollTop = chatOutput.scrollHeight;
+            },
+            error: (data) => {
+                throw new Error(data.error);
+            },
+            done: (data) => {
+                finished = data;
+            }
+        });
+
+        if (!finished) {
+            throw new Error('Response stream ended early');
+        }
+
+        return { reply, ...finished };
+    }
+
+    // Add a generated image to the chat; it links to the full-size image
+    function addImage(imageUrl, fullUrl = imageUrl) {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message bot-message';
+
+        const link = document.createElement('a');
+        link.href = fullUrl;
+        link.target = '_blank';
+
+        const img = new Image();
+        img.src = imageUrl;
+        img.alt = 'Generated Image';
+        img.style.maxWidth = '100%';
+        img.style.height = 'auto';
+
+        link.appendChild(img);
+        messageDiv.appendChild(link);
+        chatOutput.appendChild(messageDiv);
+        chatOutput.scrollTop = chatOutput.scrollHeight;
     }
 
+    // Poll a background image job and show the image once it is ready
+    async function pollImageJob(jobId, conversationId, interval = 2000) {
+        try {
+            const response = await fetch(`/api/image_job/${jobId}`);
+            if (!response.ok) return;
+            const job = await response.json();
 
+            if (job.status === 'done') {
+                if (conversationId === currentConversationId) {
+                    addImage(job.thumbnail || job.image, job.image);
+                }
+            } else if (job.status === 'failed') {
+                console.error('Image generation failed:', job.error);
+            } else {
+                setTimeout(() => pollImageJob(jobId, conversationId, interval), interval);
+            }
+        } catch (error) {
+            console.error('Error polling image job:', error);
+        }
+    }
 
     // Format bot response
     function formatBotResponse(text) {
@@ -127,7 +257,7 @@
             userInput.value = '';
             const generateImage = document.getElementById("image-gen-checkbox").checked;
             try {
-                const response = await fetch('/api/chat', {
+                const response = await fetch('/api/chat/stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -139,23 +269,15 @@
                         generate_image: generateImage
                     })
                 });
-                
-                const data = await response.json();
-                if (data.response) {
-                    addMessage('bot', data.response);
+
+                if (!response.ok) {
+                    throw new Error('Chat request failed');
                 }
 
+                const data = await streamBotReply(response);
                 
-                if (data.image) {
-                    const messageDiv = document.createElement('div');
-                    messageDiv.className = 'message bot-message';
-                    const img = new Image();
-                    img.src = 'data:image/png;base64,' + data.image;
-                    img.alt = 'Generated Image';
-                    img.style.maxWidth = '100%';
-                    messageDiv.appendChild(img);
-                    chatOutput.appendChild(messageDiv);
-                    
+                if (data.image_job) {
+                    pollImageJob(data.image_job, currentConversationId);
                 }
 
                 updateChatHistorySidebar();
@@ -166,78 +288,98 @@
         }
     }
 
-    // Update sidebar with conversation list
+    // Update sidebar with conversation list. The first call pages through the
+    // lightweight listing; later calls only fetch conversations updated since.
     async function updateChatHistorySidebar() {
         try {
-            const response = await fetch('/api/conversations');
-            const data = await response.json();
-            
-            chatHistorySidebar.innerHTML = '';
-            
-            const sortedConversations = Object.entries(data.conversations)
-                .sort((a, b) => b[1].last_updated - a[1].last_updated);
-            
-            for (const [id, conversation] of sortedConversations) {
-                const chatItem = document.createElement('div');
-                chatItem.className = 'chat-item';
-                if (id === currentConversationId) {
-                    chatItem.classList.add('active-chat');
+            let cursor = null;
+            const since = sidebarSince;
+            do {
+                const params = new URLSearchParams();
+                if (since !== null) params.set('since', since);
+                if (cursor) params.set('cursor', cursor);
+
+                const response = await fetch(`/api/conversations?${params}`);
+                const data = await response.json();
+
+                for (const conversation of data.conversations) {
+                    sidebarConversations.set(conversation.id, conversation);
+                    sidebarSince = Math.max(sidebarSince || 0, conversation.last_updated);
                 }
-                
-                const titleSpan = document.createElement('span');
-                titleSpan.className = 'chat-title';
-                titleSpan.textContent = conversation.title;
-                
-                const deleteBtn = document.createElement('button');
-                deleteBtn.className = 'delete-chat-btn';
-                deleteBtn.innerHTML = '&times;';
-                deleteBtn.addEventListener('click', (e) => deleteConversation(id, e));
-                
-                chatItem.appendChild(titleSpan);
-                chatItem.appendChild(deleteBtn);
-                chatItem.addEventListener('click', () => loadConversation(id));
-                
-                chatHistorySidebar.appendChild(chatItem);
-            }
+                cursor = data.next_cursor;
+            } while (cursor);
+
+            renderChatHistorySidebar();
         } catch (error) {
             console.error('Error fetching conversations:', error);
         }
     }
 
-    // Load a specific conversation
+    function renderChatHistorySidebar() {
+        chatHistorySidebar.innerHTML = '';
+        
+        const sortedConversations = [...sidebarConversations.values()]
+            .sort((a, b) => b.last_updated - a.last_updated);
+        
+        for (const conversation of sortedConversations) {
+            const id = conversation.id;
+            const chatItem = document.createElement('div');
+            chatItem.className = 'chat-item';
+            if (id === currentConversationId) {
+                chatItem.classList.add('active-chat');
+            }
+            
+            const titleSpan = document.createElement('span');
+            titleSpan.className = 'chat-title';
+            titleSpan.textContent = conversation.title;
+            
+            const deleteBtn = document.createElement('button');
+            deleteBtn.className = 'delete-chat-btn';
+            deleteBtn.innerHTML = '&times;';
+            deleteBtn.addEventListener('click', (e) => deleteConversation(id, e));
+            
+            chatItem.appendChild(titleSpan);
+            chatItem.appendChild(deleteBtn);
+            chatItem.addEventListener('click', () => loadConversation(id));
+            
+            chatHistorySidebar.appendChild(chatItem);
+        }
+    }
+
+    // Load a specific conversation, page by page
     async function loadConversation(conversationId) {
         window.speechSynthesis.cancel();
         try {
-            const response = await fetch('/api/conversations');
-            const data = await response.json();
+            let conversation = null;
+            const messages = [];
+            let offset = 0;
+            do {
+                const response = await fetch(`/api/conversations/${encodeURIComponent(conversationId)}/messages?offset=${offset}`);
+                if (!response.ok) return;
+                const data = await response.json();
+
+                conversation = data.conversation;
+                messages.push(...data.messages);
+                offset = data.next_offset;
+            } while (offset !== null);
+
+            currentConversationId = conversationId;
+            currentMode = conversation.mode || 'pakistan';
+            chatMode.value = currentMode;
             
-            if (data.conversations[conversationId]) {
-                currentConversationId = conversationId;
-                currentMode = data.conversations[conversationId].mode || 'pakistan';
-                chatMode.value = currentMode;
-                
-                chatOutput.innerHTML = '';
-                
-                data.conversations[conversationId].history.forEach(msg => {
-                    if (msg.user) addMessage('user', msg.user, msg.timestamp);
-                    if (msg.bot) addMessage('bot', msg.bot, msg.timestamp);
-                    if (msg.image) {
-                        const messageDiv = document.createElement('div');
-                        messageDiv.className = 'message bot-message';
-
-                        const img = new Image();
-                        img.src = 'data:image/png;base64,' + msg.image;
-                        img.alt = 'Generated Image';
-                        img.style.maxWidth = '100%';
-                        img.style.height = 'auto';
-
-                        messageDiv.appendChild(img);
-                        chatOutput.appendChild(messageDiv);
-                    }
-                });
-                
-                updateChatHistorySidebar();
-            }
+            chatOutput.innerHTML = '';
+            
+            messages.forEach(msg => {
+                if (msg.user) addMessage('user', msg.user, msg.timestamp);
+                if (msg.bot) addMessage('bot', msg.bot, msg.timestamp);
+                if (msg.image) {
+                    addImage(msg.image);
+                } else if (msg.image_job) {
+                    pollImageJob(msg.image_job, conversationId);
+                }
+            });
+            
+            updateChatHistorySidebar();
         } catch (error) {
             console.error('Error loading conversation:', error);
         }
@@ -262,8 +404,8 @@
                 
                 const data = await response.json();
                 if (data.status === 'success') {
-                    
-                    updateChatHistorySidebar();
+                    sidebarConversations.delete(conversationId);
+                    renderChatHistorySidebar();
                 }
             } catch (error) {
                 console.error('Error deleting conversation:', error);
@@ -324,6 +466,8 @@
     const audioRecordBtn = document.getElementById("audio-record-btn");
     const requestMicBtn = document.getElementById("request-mic-btn");
 
+    // Recording chunk length; each chunk is uploaded as soon as it is ready
+    const AUDIO_CHUNK_MS = 1000;
     let mediaRecorder;
     let audioChunks = [];
     let recording = false;
@@ -375,31 +519,44 @@
         }
     });
 
-    // Start recording audio
+    // Start recording audio. Chunks are uploaded as they are recorded so the
+    // server can transcribe while the user is still speaking.
     async function startRecording() {
         window.speechSynthesis.cancel();
         try {
             const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
             mediaRecorder = new MediaRecorder(stream);
 
+            const sessionId = await startAudioUpload();
+            let uploads = Promise.resolve(true);
+            let seq = 0;
+
             mediaRecorder.ondataavailable = (e) => {
                 audioChunks.push(e.data);
+                if (sessionId && e.data.size > 0) {
+                    const chunk = e.data;
+                    const chunkSeq = seq++;
+                    // Sent one after another, in order, over the same connection
+                    uploads = uploads.then((ok) => ok && uploadAudioChunk(sessionId, chunkSeq, chunk));
+                }
             };
 
             mediaRecorder.onstop = async () => {
-                const audioBlob = new Blob(audioChunks, { type: "audio/wav" });
+                stream.getTracks().forEach((track) => track.stop());
+                const audioBlob = new Blob(audioChunks, { type: mediaRecorder.mimeType });
                 audioChunks = [];
 
-                // Convert Blob to File or base64 as needed and send to backend
-                const reader = new FileReader();
-                reader.onloadend = () => {
-                    const base64Audio = reader.result.split(",")[1];
-                    sendAudioMessage(base64Audio);
-                };
-                reader.readAsDataURL(audioBlob);
+                const form = new FormData();
+                if (sessionId && await uploads) {
+                    form.append("session_id", sessionId);
+                } else {
+                    // Chunked upload unavailable or interrupted: send the whole recording
+                    form.append("audio", audioBlob, "recording");
+                }
+                sendAudioMessage(form);
             };
 
-            mediaRecorder.start();
+            mediaRecorder.start(AUDIO_CHUNK_MS);
             recording = true;
             audioRecordBtn.classList.add("recording");
             console.log("Recording started");
@@ -408,6 +565,24 @@
         }
     }
 
+    async function startAudioUpload() {
+        try {
+            const response = await fetch("/api/audio", { method: "POST" });
+            return response.ok ? (await response.json()).session_id : null;
+        } catch (error) {
+            return null;
+        }
+    }
+
+    async function uploadAudioChunk(sessionId, seq, chunk) {
+        try {
+            const response = await fetch(`/api/audio/${sessionId}/${seq}`, { method: "PUT", body: chunk });
+            return response.ok;
+        } catch (error) {
+            return false;
+        }
+    }
+
     // Stop recording audio
     function stopRecording() {
         if (mediaRecorder && recording) {
@@ -418,55 +593,36 @@
         }
     }
 
-    // Send audio data to backend
-    async function sendAudioMessage(base64Audio) {
+    // Send the recording (or its upload session) to the backend as multipart form data
+    async function sendAudioMessage(form) {
         try {
             addMessage("user", "[Audio message sent]");
             const generateImage = document.getElementById("image-gen-checkbox").checked;
-            const response = await fetch("/chat-audio", {
+            if (currentConversationId) {
+                form.append("conversation_id", currentConversationId);
+            }
+            form.append("mode", currentMode);
+            form.append("generate_image", generateImage);
+            const response = await fetch("/chat-audio/stream", {
                 method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                },
-                body: JSON.stringify({
-                    audio: base64Audio,
-                    conversation_id: currentConversationId,
-                    mode: currentMode,
-                    generate_image: generateImage
-                }),
+                body: form,
             });
 
-            const data = await response.json();
-
             if (!response.ok) {
-                throw new Error(data.message || "Audio chat error");
+                const error = await response.json();
+                throw new Error(error.message || "Audio chat error");
             }
 
+            // Show the transcript, then the bot reply as it streams in
+            const data = await streamBotReply(response, (userMessage) => addMessage("user", userMessage));
+
             currentConversationId = data.conversation_id;
 
-            // Show bot reply text
-            addMessage("user", data.user_message);
-            addMessage("bot", data.reply);
-            
-            if (data.image) {
-                    const messageDiv = document.createElement('div');
-                    messageDiv.className = 'message bot-message';
-                    const img = new Image();
-                    img.src = 'data:image/png;base64,' + data.image;
-                    img.alt = 'Generated Image';
-                    img.style.maxWidth = '100%';
-
-                    
-                    // Append image and button
-                    messageDiv.appendChild(img);
-                    chatOutput.appendChild(messageDiv);
-                }
-            // Play audio if returned by backend
-            /*
-            if (data.audio_base64) {
-                const audio = new Audio(data.audio_base64);
-                audio.play();
-            }*/
+            if (data.image_job) {
+                pollImageJob(data.image_job, currentConversationId);
+            }
+
+            updateChatHistorySidebar();
 
             // Optionally speak the text as well
             speakText(data.reply);
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import document_parser
+import metrics
+from jobs import JobRegistry
+from LLM import get_result
+
+logger = logging.getLogger(__name__)
+
+# Long documents are summarized map-reduce style: pieces are summarized in
+# parallel, then combined SUMMARY_FANOUT at a time until one summary is left.
+# Every LLM result is cached by the hash of its input, so re-summarizing an
+# edited report only re-runs the pieces (and the reduce path) that changed.
+_map_executor = ThreadPoolExecutor(max_workers=config.SUMMARY_MAP_WORKERS, thread_name_prefix="summary-map")
+_job_executor = ThreadPoolExecutor(max_workers=config.SUMMARY_JOB_WORKERS, thread_name_prefix="summary")
+_lock = threading.Lock()
+_cache = OrderedDict()
+_jobs = JobRegistry()
+
+UNIT_SPLIT = re.compile(r'\n+|(?<=[.!?])\s+')
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _cached(key, compute):
+    with _lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+            return value, True
+    value = compute()
+    with _lock:
+        _cache[key] = value
+        while len(_cache) > config.SUMMARY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value, False
+
+
+def split_pieces(text, max_words=None, min_words=None):
+    """Split `text` into pieces of at most `max_words` words on sentence/line boundaries.
+
+    Past `min_words`, a piece ends after a unit whose hash picks it as a
+    boundary, so the cut points depend on the content rather than on word
+    offsets and re-synchronise right after an edit.
+    """
+    max_words = max_words or config.SUMMARY_CHUNK_WORDS
+    min_words = min(min_words or config.SUMMARY_MIN_CHUNK_WORDS, max_words)
+    pieces, current, size = [], [], 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            pieces.append(" ".join(current))
+        current, size = [], 0
+
+    for unit in UNIT_SPLIT.split(text):
+        words = unit.split()
+        # Overlong units (no punctuation or line breaks) fall back to fixed windows.
+        for start in range(0, len(words), max_words):
+            part = words[start:start + max_words]
+            if size + len(part) > max_words:
+                flush()
+            current.append(" ".join(part))
+            size += len(part)
+            if size >= min_words and int(_hash(current[-1])[:8], 16) % 8 == 0:
+                flush()
+    flush()
+    return pieces
+
+
+def summarize(text, chunk_words=None, max_words=None):
+    """Summarize a long text. Returns the summary and counts of pieces, levels and cache hits."""
+    start = time.time()
+    max_words = max_words or config.SUMMARY_PIECE_WORDS
+    llm = get_result()
+    stats = {"pieces": 0, "levels": 0, "llm_calls": 0, "cached": 0}
+
+    def run(items, key_prefix, compute):
+        results = list(_map_executor.map(
+            lambda item: _cached(_hash(f"{key_prefix}:{max_words}:{item}"), lambda: compute(item)),
+            items
+        ))
+        for _, hit in results:
+            stats["cached" if hit else "llm_calls"] += 1
+        return [value for value, _ in results]
+
+    pieces = split_pieces(text, chunk_words)
+    stats["pieces"] = len(pieces)
+    if not pieces:
+        return {"summary": "", **stats, "seconds": 0.0}
+
+    # Map
+    summaries = run(pieces, "map", lambda piece: llm.llama_summarize(piece, max_words=max_words))
+
+    # Reduce, as a tree when there are too many partial summaries for one prompt.
+    fanout = max(config.SUMMARY_FANOUT, 2)
+    while len(summaries) > 1:
+        stats["levels"] += 1
+        groups = ["\n".join(summaries[i:i + fanout]) for i in range(0, len(summaries), fanout)]
+        summaries = run(groups, "reduce", llm.combine_summaries)
+
+    stats["seconds"] = round(time.time() - start, 3)
+    logger.info("Summarized %d pieces in %ss: %d LLM calls, %d cached, %d reduce levels",
+                stats['pieces'], stats['seconds'], stats['llm_calls'], stats['cached'], stats['levels'])
+    return {"summary": summaries[0], **stats}
+
+
+def _run(job, filename, data):
+    metrics.set_request_id(job['request_id'])
+    _jobs.update(job, status='running')
+    try:
+        if filename is not None:
+            # Parsing is CPU-bound; it goes to the parser pool like uploads do.
+            with metrics.span("parse"):
+                text, _ = document_parser.get_pool().submit(document_parser.parse_file, filename, data).result()
+        else:
+            text = data
+        result = summarize(text)
+        _jobs.finish(job, summary=result.pop('summary'), stats=result)
+    except Exception as e:
+        logger.exception("Summarization failed")
+        _jobs.finish(job, error=e)
+
+
+def submit(text=None, filename=None, data=None):
+    """Queue a summary of `text` (or of an uploaded file) and return the job ID. Identical inputs share one job."""
+    payload = text if filename is None else data
+    job_id = hashlib.sha256(payload.encode("utf-8") if isinstance(payload, str) else payload).hexdigest()[:16]
+    job, created = _jobs.add(job_id, name=filename, summary=None, stats=None)
+    if created:
+        _job_executor.submit(_run, job, filename, payload)
+    return job_id
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
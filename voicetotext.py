@@ -1,8 +1,167 @@
-import whisper
+import os
+import subprocess
+import tempfile
+import threading
 
-def transcribe(path):
-    model = whisper.load_model("base")
-    result = model.transcribe(path)
+import numpy as np
+
+import backpressure
+import config
+import metrics
+import registry
+
+SAMPLE_RATE = 16000
+
+
+def get_model(size=None):
+    size = size or config.WHISPER_MODEL
+
+    def load():
+        if not config.ENABLE_SPEECH:
+            raise RuntimeError("Speech input is disabled (ENABLE_SPEECH=0)")
+        import whisper
+        return whisper.load_model(size)
+
+    return registry.get_model(f"whisper_{size}", load)
+
+
+def _ffmpeg_command(sample_rate):
+    return [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "pipe:1",
+    ]
+
+
+def _to_float(pcm):
+    return np.frombuffer(pcm, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def decode_audio(data, sample_rate=SAMPLE_RATE):
+    """Decode encoded audio bytes (wav/webm/ogg...) to mono float32 PCM via an ffmpeg pipe."""
+    try:
+        out = subprocess.run(_ffmpeg_command(sample_rate), input=data, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode(errors='ignore')}") from e
+
+    return _to_float(out)
+
+
+class StreamDecoder:
+    """Decode a recording while it is still arriving, through one long-running ffmpeg process.
+
+    Each uploaded byte is decoded once, however long the recording gets.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(_ffmpeg_command(sample_rate), stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, stderr=self._stderr)
+        self._lock = threading.Lock()
+        self._parts = []
+        self._odd_byte = b""
+        self._reader = threading.Thread(target=self._read, name="audio-decode", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        fd = self._process.stdout.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                return
+            data = self._odd_byte + data
+            cut = len(data) - len(data) % 2
+            self._odd_byte = data[cut:]
+            with self._lock:
+                self._parts.append(_to_float(data[:cut]))
+
+    def feed(self, data):
+        try:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            raise RuntimeError(f"Failed to decode audio: {self._errors()}") from e
+
+    def audio(self):
+        """Everything decoded so far, as float32 PCM."""
+        with self._lock:
+            if len(self._parts) != 1:
+                self._parts = [np.concatenate(self._parts) if self._parts else np.zeros(0, np.float32)]
+            return self._parts[0]
+
+    def close(self):
+        """Decode the rest of the input and return the whole recording."""
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join()
+        if self._process.wait() != 0 and len(self.audio()) == 0:
+            raise RuntimeError(f"Failed to decode audio: {self._errors()}")
+        self._stderr.close()
+        return self.audio()
+
+    def kill(self):
+        self._process.kill()
+        self._process.wait()
+        self._stderr.close()
+
+    def _errors(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="ignore")
+
+
+def trim_silence(audio, sample_rate=SAMPLE_RATE, threshold_db=None, frame_ms=30, padding_ms=200):
+    """Drop leading and trailing frames whose RMS energy is below `threshold_db` (dBFS)."""
+    if threshold_db is None:
+        threshold_db = config.VAD_THRESHOLD_DB
+
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return audio
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    voiced = np.nonzero(20 * np.log10(rms + 1e-10) > threshold_db)[0]
+    if len(voiced) == 0:
+        return audio[:0]
+
+    padding = int(sample_rate * padding_ms / 1000)
+    start = max(voiced[0] * frame - padding, 0)
+    end = min((voiced[-1] + 1) * frame + padding, len(audio))
+    return audio[start:end]
+
+
+def quietest_point(audio, sample_rate=SAMPLE_RATE, search_ms=1000, frame_ms=30):
+    """Index of the quietest frame in the last `search_ms` of `audio`, a safe place to cut between words."""
+    frame = int(sample_rate * frame_ms / 1000)
+    start = max(len(audio) - int(sample_rate * search_ms / 1000), 0)
+    n_frames = (len(audio) - start) // frame
+    if n_frames == 0:
+        return len(audio)
+
+    frames = audio[start:start + n_frames * frame].reshape(n_frames, frame)
+    return start + int(np.argmin(np.mean(frames ** 2, axis=1))) * frame
+
+
+def transcribe(audio, prompt=None):
+    """Transcribe a file path, raw encoded audio bytes or a float32 PCM array.
+
+    `prompt` is the text heard so far when transcribing a recording piece by piece.
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        with metrics.span("audio_decode"):
+            audio = decode_audio(bytes(audio))
+    if isinstance(audio, np.ndarray):
+        audio = trim_silence(audio)
+        if len(audio) == 0:
+            return ""
+
+    model = get_model()
+    with backpressure.TRANSCRIBER.slot(), metrics.span("transcribe"):
+        result = model.transcribe(audio, initial_prompt=prompt) if prompt else model.transcribe(audio)
 
     return result["text"]
 